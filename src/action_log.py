@@ -0,0 +1,257 @@
+import logging
+import shutil
+import tempfile
+import time
+from collections import deque
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QRect, QRectF, QSize, QTimer
+from PyQt6.QtGui import QColor, QFont, QFontMetrics, QPainter, QPainterPath, QPen
+from PyQt6.QtWidgets import QListView, QStyledItemDelegate, QAbstractItemView
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 1000
+EntryRole = Qt.ItemDataRole.UserRole + 1
+
+# Entry kinds and how they are drawn: pills are single-line rounded badges, the others wrap
+PILL_KINDS = {'action', 'screenshot', 'completion'}
+ACCENT = QColor('#4CAF50')
+GOLD = QColor('#FFD700')
+PILL_BACKGROUND = QColor(45, 45, 45, 242)
+PILL_BORDER = QColor(255, 255, 255, 26)
+ASSISTANT_BORDER = QColor('#666666')
+MUTED_TEXT = QColor('#666666')
+FONT_FAMILY = 'Inter'
+FONT_SIZE = 13
+PILL_PADDING = (12, 4)  # Horizontal, vertical
+PILL_MARGIN = 6
+ASSISTANT_PADDING = (16, 8)
+ASSISTANT_MARGIN = 8
+TEXT_PADDING = 4
+# Streamed text is laid out and scrolled into view at most this often (ms)
+RELAYOUT_INTERVAL = 50
+
+
+class LogEntry:
+    """One line of the action log.
+
+    `icon` and `label` are shown first, `detail` after them in the accent color (pills), or
+    `text` is shown wrapped (assistant messages and plain messages).
+    """
+    __slots__ = ('kind', 'icon', 'label', 'detail', 'text', 'time', 'frame')
+
+    def __init__(self, kind, text='', icon='', label='', detail='', frame=None):
+        self.kind = kind
+        self.text = text
+        self.icon = icon
+        self.label = label
+        self.detail = detail
+        self.time = time.time()
+        self.frame = frame  # Screenshot shown when a screenshot pill is clicked
+
+    def plain_text(self):
+        body = self.text or ' '.join(part for part in (self.icon, self.label, self.detail) if part)
+        return f"{time.strftime('%H:%M:%S', time.localtime(self.time))} [{self.kind}] {body}"
+
+
+class ActionLogModel(QAbstractListModel):
+    """The most recent `max_entries` log entries, for display.
+
+    Every entry is also written to a temporary spool file as it is superseded, so the full
+    log of a run can be exported even after old entries have dropped out of the view.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, parent=None):
+        super().__init__(parent)
+        self.entries = deque()
+        self.max_entries = max_entries
+        self.spool = tempfile.TemporaryFile('w+', encoding='utf-8')
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.entries)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.entries):
+            return None
+        entry = self.entries[index.row()]
+        if role == EntryRole:
+            return entry
+        if role == Qt.ItemDataRole.DisplayRole:
+            return entry.plain_text()
+        return None
+
+    def append(self, entry):
+        if self.entries:
+            # The previous entry can't change anymore (only the last one receives streamed text)
+            self.spool.write(self.entries[-1].plain_text() + '\n')
+        self.trim(self.max_entries - 1)
+        row = len(self.entries)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.entries.append(entry)
+        self.endInsertRows()
+
+    def append_text(self, text):
+        """Add streamed text to the last entry"""
+        if not self.entries:
+            return
+        self.entries[-1].text += text
+        index = self.index(len(self.entries) - 1)
+        self.dataChanged.emit(index, index)
+
+    def trim(self, max_entries):
+        excess = len(self.entries) - max(max_entries, 0)
+        if excess > 0:
+            self.beginRemoveRows(QModelIndex(), 0, excess - 1)
+            for _ in range(excess):
+                self.entries.popleft()
+            self.endRemoveRows()
+
+    def set_max_entries(self, max_entries):
+        self.max_entries = max(max_entries, 1)
+        self.trim(self.max_entries)
+
+    def clear(self):
+        self.beginResetModel()
+        self.entries.clear()
+        self.endResetModel()
+        self.spool.seek(0)
+        self.spool.truncate()
+
+    def export(self, path):
+        """Write every entry since the last clear to `path`, streaming from the spool"""
+        self.spool.flush()
+        self.spool.seek(0)
+        with open(path, 'w', encoding='utf-8') as f:
+            shutil.copyfileobj(self.spool, f)
+            if self.entries:
+                f.write(self.entries[-1].plain_text() + '\n')
+        self.spool.seek(0, 2)  # Back to the end for the next append
+        logger.info("Exported action log to %s", path)
+
+
+class ActionLogDelegate(QStyledItemDelegate):
+    """Paints log entries with QPainter, pills as rounded badges and messages as wrapped text"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.font = QFont(FONT_FAMILY)
+        self.font.setPixelSize(FONT_SIZE)
+        self.small_font = QFont(self.font)
+        self.small_font.setPixelSize(FONT_SIZE - 1)
+        self.small_font.setItalic(True)
+        self.text_color = QColor('#e0e0e0')
+
+    def set_text_color(self, color):
+        self.text_color = QColor(color)
+
+    def available_width(self, option):
+        view = self.parent()
+        return (view.viewport().width() if view is not None else option.rect.width()) - 1
+
+    def sizeHint(self, option, index):
+        entry = index.data(EntryRole)
+        metrics = QFontMetrics(self.font)
+        width = self.available_width(option)
+        if entry.kind in PILL_KINDS:
+            return QSize(width, metrics.height() + 2 * PILL_PADDING[1] + 2 * PILL_MARGIN)
+        font, padding, margin = self.text_layout(entry)
+        text_rect = QFontMetrics(font).boundingRect(
+            QRect(0, 0, max(width - 2 * padding[0], 1), 0), Qt.TextFlag.TextWordWrap, self.display_text(entry))
+        return QSize(width, text_rect.height() + 2 * padding[1] + 2 * margin)
+
+    def text_layout(self, entry):
+        """Font, (horizontal, vertical) padding and vertical margin of a wrapped text entry"""
+        if entry.kind == 'assistant':
+            return self.font, ASSISTANT_PADDING, ASSISTANT_MARGIN
+        if entry.kind == 'assistant_action':
+            return self.small_font, (0, TEXT_PADDING), 0
+        return self.font, (0, TEXT_PADDING), 0
+
+    def display_text(self, entry):
+        if entry.kind == 'assistant':
+            return f"💬 {entry.text}"
+        if entry.kind == 'assistant_action':
+            return f"🤖 {entry.text}"
+        return entry.text
+
+    def paint(self, painter, option, index):
+        entry = index.data(EntryRole)
+        painter.save()
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        if entry.kind in PILL_KINDS:
+            self.paint_pill(painter, option.rect, entry)
+        else:
+            self.paint_text(painter, option.rect, entry)
+        painter.restore()
+
+    def paint_pill(self, painter, rect, entry):
+        metrics = QFontMetrics(self.font)
+        painter.setFont(self.font)
+        icon = f"{entry.icon} " if entry.icon else ''
+        rest = ' '.join(part for part in (entry.label, entry.detail) if part)
+        max_text_width = rect.width() - 2 * PILL_PADDING[0] - metrics.horizontalAdvance(icon)
+        rest = metrics.elidedText(rest, Qt.TextElideMode.ElideRight, max(max_text_width, 0))
+        text_width = metrics.horizontalAdvance(icon) + metrics.horizontalAdvance(rest)
+
+        height = metrics.height() + 2 * PILL_PADDING[1]
+        pill = QRectF(rect.left() + 0.5, rect.top() + PILL_MARGIN + 0.5, text_width + 2 * PILL_PADDING[0], height)
+        path = QPainterPath()
+        path.addRoundedRect(pill, height / 2, height / 2)
+        painter.setPen(QPen(PILL_BORDER, 1))
+        painter.fillPath(path, PILL_BACKGROUND)
+        painter.drawPath(path)
+
+        x = int(pill.left()) + PILL_PADDING[0]
+        baseline = int(pill.top()) + PILL_PADDING[1] + metrics.ascent()
+        if icon:
+            painter.setPen(QColor('#ffffff'))
+            painter.drawText(x, baseline, icon)
+            x += metrics.horizontalAdvance(icon)
+        painter.setPen(GOLD if entry.kind == 'completion' else ACCENT)
+        painter.drawText(x, baseline, rest)
+
+    def paint_text(self, painter, rect, entry):
+        font, padding, margin = self.text_layout(entry)
+        painter.setFont(font)
+        inner = rect.adjusted(padding[0], margin + padding[1], -padding[0], -(margin + padding[1]))
+        if entry.kind == 'assistant':
+            painter.fillRect(QRect(rect.left(), rect.top() + margin, 2, rect.height() - 2 * margin), ASSISTANT_BORDER)
+        painter.setPen(MUTED_TEXT if entry.kind == 'assistant_action' else self.text_color)
+        painter.drawText(inner, Qt.TextFlag.TextWordWrap, self.display_text(entry))
+
+
+class ActionLogView(QListView):
+    """QListView set up for the action log, items are laid out again when the width changes"""
+
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+        self.setModel(model)
+        self.setItemDelegate(ActionLogDelegate(self))
+        self.setResizeMode(QListView.ResizeMode.Adjust)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.setSelectionMode(QAbstractItemView.SelectionMode.NoSelection)
+        self.setFocusPolicy(Qt.FocusPolicy.NoFocus)
+        self.setMouseTracking(True)
+        model.rowsInserted.connect(lambda *args: self.scrollToBottom())
+        self.relayout_timer = QTimer(self)
+        self.relayout_timer.setSingleShot(True)
+        self.relayout_timer.setInterval(RELAYOUT_INTERVAL)
+        self.relayout_timer.timeout.connect(self.relayout)
+
+    def dataChanged(self, top_left, bottom_right, roles=()):
+        # Streamed text can change an entry's height, but QListView lays out every entry again
+        # on each dataChanged and a delta arrives every few ms. Only repaint here and lay out
+        # once per interval.
+        self.viewport().update()
+        if not self.relayout_timer.isActive():
+            self.relayout_timer.start()
+
+    def relayout(self):
+        self.doItemsLayout()
+        self.scrollToBottom()
+
+    def mouseMoveEvent(self, event):
+        index = self.indexAt(event.position().toPoint())
+        entry = index.data(EntryRole) if index.isValid() else None
+        self.viewport().setCursor(Qt.CursorShape.PointingHandCursor if entry is not None and entry.kind == 'screenshot'
+                                  else Qt.CursorShape.ArrowCursor)
+        super().mouseMoveEvent(event)
@@ -1,117 +1,353 @@
 import anthropic
 from anthropic.types.beta import BetaMessage, BetaTextBlock, BetaToolUseBlock
+import importlib.util
 import os
+import time
 from dotenv import load_dotenv
 import logging
-import json
+from .config import get_config_service
+from .frame import image_source_size, encode_image_sources, resolve_image_sources
+from .metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Number of screenshots kept in the history sent to the model, older ones are elided
+DEFAULT_MAX_SCREENSHOTS = 3
+# Old screenshots are elided this many at a time, so the history prefix (and its prompt cache
+# entry) stays the same for this many steps instead of changing on every step
+DEFAULT_SCREENSHOT_PRUNE_BATCH = 4
+SCREENSHOT_PLACEHOLDER = "[Older screenshot removed to save context]"
+CACHE_CONTROL = {"type": "ephemeral"}
+# Id of the finish_run tool use added to text-only responses
+SYNTHETIC_FINISH_ID = "synthetic_finish"
+
+# HTTP connection pool defaults. Idle connections are kept long enough to survive the gap
+# between steps and the time it takes to type an instruction after warm-up.
+DEFAULT_MAX_CONNECTIONS = 10
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 5
+DEFAULT_KEEPALIVE_EXPIRY = 120.0
+DEFAULT_TIMEOUT = 120.0
+DEFAULT_CONNECT_TIMEOUT = 10.0
+
+BASE_SYSTEM_PROMPT = """
+    The user will ask you to perform a task and you should use their computer to do so. 
+    After each step, take a screenshot and carefully evaluate if you have achieved the right outcome. 
+    Explicitly show your thinking: 'I have evaluated step X...' 
+    If not correct, try again. Only when you confirm a step was executed correctly should you move 
+    on to the next one. Note that you have to click into the browser address bar before typing a URL. 
+    You should always call a tool! Always return a tool call. Remember call the finish_run tool when you 
+    have achieved the goal of the task. Do not explain you have finished the task, just call the tool. 
+    Use keyboard shortcuts to navigate whenever possible. Please remember to take a screenshot after 
+    EVERY step to confirm you have achieved the right outcome.
+    If the target window is not in focus, then you may need to click on it a second time before clicking on the
+    object within it, like a button. Verify that you got the result you expected by taking a screenshot
+    and evaluate whether you need to adjust accordingly.
+"""
 
 class AnthropicClient:
-    def __init__(self):
+    def __init__(self, config_service=None):
         load_dotenv()  # Load environment variables from .env file
         self.api_key = os.getenv("ANTHROPIC_API_KEY")
         if not self.api_key:
             raise ValueError("ANTHROPIC_API_KEY not found in environment variables")
         
+        self.config_service = config_service or get_config_service()
+        
         try:
-            self.client = anthropic.Anthropic(api_key=self.api_key)
+            # Connection settings are only read here, changing them needs a restart
+            http_options = self.http_client_options(self.config_service.config)
+            self.async_client = anthropic.AsyncAnthropic(
+                api_key=self.api_key,
+                http_client=anthropic.DefaultAsyncHttpxClient(**http_options),
+            )
         except Exception as e:
             raise ValueError(f"Failed to initialize Anthropic client: {str(e)}")
+
+        # System prompt and request settings are rebuilt only when config.json changes
+        self.config_service.subscribe(self.on_config_changed)
+
+    def http_client_options(self, config):
+        """HTTP client settings for the connection pool, keep-alive, timeouts and HTTP/2.
+
+        Built from the SDK's own types, the HTTP library it uses may not be the `httpx` package.
+        """
+        http2 = config.get('http2', False)
+        if http2 and importlib.util.find_spec('h2') is None:
+            logger.warning("HTTP/2 requested but the 'h2' package isn't installed, using HTTP/1.1")
+            http2 = False
+        return dict(
+            limits=type(anthropic.DEFAULT_CONNECTION_LIMITS)(
+                max_connections=config.get('http_max_connections', DEFAULT_MAX_CONNECTIONS),
+                max_keepalive_connections=config.get('http_max_keepalive_connections', DEFAULT_MAX_KEEPALIVE_CONNECTIONS),
+                keepalive_expiry=config.get('http_keepalive_expiry', DEFAULT_KEEPALIVE_EXPIRY),
+            ),
+            timeout=anthropic.Timeout(
+                config.get('http_timeout', DEFAULT_TIMEOUT),
+                connect=config.get('http_connect_timeout', DEFAULT_CONNECT_TIMEOUT),
+            ),
+            http2=http2,
+        )
+
+    async def warm_up_async(self):
+        """Open a pooled connection (DNS, TCP and TLS) with a cheap request that uses no tokens"""
+        start = time.perf_counter()
+        await self.async_client.models.list(limit=1)
+        logger.info("Warmed up API connection in %.0f ms", (time.perf_counter() - start) * 1000)
         
-    def get_next_action(self, run_history) -> BetaMessage:
-        try:
-            # Load system prompt from config
-            config_file = 'config.json'
-            base_system_prompt = """
-                The user will ask you to perform a task and you should use their computer to do so. 
-                After each step, take a screenshot and carefully evaluate if you have achieved the right outcome. 
-                Explicitly show your thinking: 'I have evaluated step X...' 
-                If not correct, try again. Only when you confirm a step was executed correctly should you move 
-                on to the next one. Note that you have to click into the browser address bar before typing a URL. 
-                You should always call a tool! Always return a tool call. Remember call the finish_run tool when you 
-                have achieved the goal of the task. Do not explain you have finished the task, just call the tool. 
-                Use keyboard shortcuts to navigate whenever possible. Please remember to take a screenshot after 
-                EVERY step to confirm you have achieved the right outcome.
-                If the target window is not in focus, then you may need to click on it a second time before clicking on the
-                object within it, like a button. Verify that you got the result you expected by taking a screenshot
-                and evaluate whether you need to adjust accordingly.
-            """
-            
-            system_prompt = base_system_prompt
-            
-            if os.path.exists(config_file):
-                with open(config_file, 'r') as f:
-                    config = json.load(f)
-                    additional_prompt = config.get('additional_system_prompt', '').strip()
-                    if additional_prompt:
-                        system_prompt = f"{base_system_prompt}\n\nAdditional Instructions:\n{additional_prompt}"
-
-            # Convert BetaMessage objects to dictionaries
-            cleaned_history = []
-            for message in run_history:
-                if isinstance(message, BetaMessage):
-                    cleaned_history.append({
-                        "role": message.role,
-                        "content": message.content
-                    })
-                elif isinstance(message, dict):
-                    cleaned_history.append(message)
-                else:
-                    raise ValueError(f"Unexpected message type: {type(message)}")
-            
-            response = self.client.beta.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=1024,
-                tools=[
-                    {
-                        "type": "computer_20241022",
-                        "name": "computer",
-                        "display_width_px": 1280,
-                        "display_height_px": 800,
-                        "display_number": 1,
-                    },
-                    {
-                        "name": "finish_run",
-                        "description": "Call this function when you have achieved the goal of the task.",
-                        "input_schema": {
-                            "type": "object",
-                            "properties": {
-                                "success": {
-                                    "type": "boolean",
-                                    "description": "Whether the task was successful"
-                                },
-                                "error": {
-                                    "type": "string",
-                                    "description": "The error message if the task was not successful"
-                                }
+    def on_config_changed(self, config):
+        """Rebuild the cached request settings, called by the config service after each reload"""
+        system_prompt = BASE_SYSTEM_PROMPT
+        additional_prompt = config.get('additional_system_prompt', '').strip()
+        if additional_prompt:
+            system_prompt = f"{BASE_SYSTEM_PROMPT}\n\nAdditional Instructions:\n{additional_prompt}"
+
+        self.request_config = {
+            'system_prompt': system_prompt,
+            'max_screenshots': config.get('max_screenshots_in_history', DEFAULT_MAX_SCREENSHOTS),
+            'prune_batch': config.get('screenshot_prune_batch', DEFAULT_SCREENSHOT_PRUNE_BATCH),
+            'stream_responses': config.get('stream_responses', True),
+        }
+
+    def load_request_config(self):
+        """Return the settings used to build and send the next request"""
+        self.config_service.check()
+        return self.request_config
+
+    def build_request(self, run_history, request_config=None, encoded_images=None):
+        """Build the keyword arguments for messages.create from the run history
+
+        `encoded_images` is the result of prepare_images, if it was called for this request.
+        """
+        with get_metrics().span('build_request'):
+            return self._build_request(run_history, request_config, encoded_images)
+
+    def prepare_images(self, run_history, request_config, pending_images=1):
+        """Base64-encode the screenshots the next request will resend, ahead of building it.
+
+        Called while the next observation is captured and encoded on the computer thread, so
+        this work overlaps with it instead of adding to the time before the request is sent.
+        `pending_images` is the number of images still to be added to the history.
+        """
+        with get_metrics().span('prepare_images'):
+            history, _, _ = self.prune_screenshots(self.message_dicts(run_history), request_config['max_screenshots'],
+                                                   request_config['prune_batch'], pending_images)
+            return encode_image_sources(history)
+
+    def message_dicts(self, run_history):
+        """The run history with BetaMessage objects converted to dictionaries"""
+        cleaned_history = []
+        for message in run_history:
+            if isinstance(message, BetaMessage):
+                cleaned_history.append({
+                    "role": message.role,
+                    "content": message.content
+                })
+            elif isinstance(message, dict):
+                cleaned_history.append(message)
+            else:
+                raise ValueError(f"Unexpected message type: {type(message)}")
+        return cleaned_history
+
+    def _build_request(self, run_history, request_config=None, encoded_images=None):
+        request_config = request_config or self.load_request_config()
+        system_prompt = request_config['system_prompt']
+        max_screenshots = request_config['max_screenshots']
+        cleaned_history = self.message_dicts(run_history)
+
+        # Only keep the most recent screenshots, older ones are replaced by a placeholder
+        cleaned_history, dropped_images, dropped_bytes = self.prune_screenshots(
+            cleaned_history, max_screenshots, request_config['prune_batch'])
+        if dropped_images:
+            logger.info("Dropped %s old screenshots (%s bytes) from request", dropped_images, dropped_bytes)
+
+        # Moving cache breakpoint so the next step can reuse everything sent so far
+        # Screenshots are only base64-encoded (or read back from the run journal) now, after pruning
+        cleaned_history = resolve_image_sources(cleaned_history, encoded_images)
+
+        cleaned_history = self.add_cache_breakpoint(cleaned_history)
+        
+        return dict(
+            model="claude-3-5-sonnet-20241022",
+            max_tokens=1024,
+            tools=[
+                {
+                    "type": "computer_20241022",
+                    "name": "computer",
+                    "display_width_px": 1280,
+                    "display_height_px": 800,
+                    "display_number": 1,
+                },
+                {
+                    "name": "finish_run",
+                    "description": "Call this function when you have achieved the goal of the task.",
+                    "input_schema": {
+                        "type": "object",
+                        "properties": {
+                            "success": {
+                                "type": "boolean",
+                                "description": "Whether the task was successful"
                             },
-                            "required": ["success"]
-                        }
-                    }
-                ],
-                messages=cleaned_history,
-                system=system_prompt,
-                betas=["computer-use-2024-10-22"],
-            )
+                            "error": {
+                                "type": "string",
+                                "description": "The error message if the task was not successful"
+                            }
+                        },
+                        "required": ["success"]
+                    },
+                    "cache_control": CACHE_CONTROL
+                }
+            ],
+            messages=cleaned_history,
+            system=[
+                {
+                    "type": "text",
+                    "text": system_prompt,
+                    "cache_control": CACHE_CONTROL
+                }
+            ],
+            betas=["computer-use-2024-10-22", "prompt-caching-2024-07-31"],
+        )
+
+    def handle_response(self, response) -> BetaMessage:
+        usage = response.usage
+        logger.info(
+            "Token usage: input=%s output=%s cache_read=%s cache_write=%s",
+            usage.input_tokens, usage.output_tokens,
+            getattr(usage, 'cache_read_input_tokens', 0) or 0,
+            getattr(usage, 'cache_creation_input_tokens', 0) or 0,
+        )
+
+        # If Claude responds with just text (no tool use), create a finish_run action with the message
+        has_tool_use = any(isinstance(content, BetaToolUseBlock) for content in response.content)
+        if not has_tool_use:
+            text_content = next((content.text for content in response.content if isinstance(content, BetaTextBlock)), "")
+            # Create a synthetic tool use block for finish_run
+            response.content.append(BetaToolUseBlock(
+                id=SYNTHETIC_FINISH_ID,
+                type="tool_use",
+                name="finish_run",
+                input={
+                    "success": False,
+                    "error": f"Claude needs more information: {text_content}"
+                }
+            ))
+            logger.info("Added synthetic finish_run for text-only response: %s", text_content)
+
+        return response
+
+    async def get_next_action_async(self, run_history, request_config=None, encoded_images=None) -> BetaMessage:
+        """Request the next action from the model, must be awaited on Store's event loop"""
+        try:
+            request = self.build_request(run_history, request_config, encoded_images)
+            metrics = get_metrics()
+            start = time.perf_counter()
+            # A streaming response object so the time until the headers arrive can be recorded
+            async with self.async_client.beta.messages.with_streaming_response.create(**request) as raw_response:
+                metrics.record('api_ttfb', time.perf_counter() - start)
+                response = await raw_response.parse()
+            metrics.record('api', time.perf_counter() - start)
+            return self.handle_response(response)
 
-            # If Claude responds with just text (no tool use), create a finish_run action with the message
-            has_tool_use = any(isinstance(content, BetaToolUseBlock) for content in response.content)
-            if not has_tool_use:
-                text_content = next((content.text for content in response.content if isinstance(content, BetaTextBlock)), "")
-                # Create a synthetic tool use block for finish_run
-                response.content.append(BetaToolUseBlock(
-                    id="synthetic_finish",
-                    type="tool_use",
-                    name="finish_run",
-                    input={
-                        "success": False,
-                        "error": f"Claude needs more information: {text_content}"
-                    }
-                ))
-                logging.info(f"Added synthetic finish_run for text-only response: {text_content}")
-
-            return response
-            
         except anthropic.APIError as e:
             raise Exception(f"API Error: {str(e)}")
         except Exception as e:
             raise Exception(f"Unexpected error: {str(e)}")
+
+    async def stream_next_action(self, run_history, request_config=None, on_text=None, on_tool_use=None,
+                                 encoded_images=None) -> BetaMessage:
+        """Streaming variant of get_next_action_async.
+
+        `on_text` is called with each text delta as it arrives and `on_tool_use` with each
+        tool_use block as soon as its input JSON is complete, before the message has finished.
+        """
+        try:
+            request = self.build_request(run_history, request_config, encoded_images)
+            metrics = get_metrics()
+            start = time.perf_counter()
+            first_event = True
+            async with self.async_client.beta.messages.stream(**request) as stream:
+                async for event in stream:
+                    if first_event:
+                        metrics.record('api_ttfb', time.perf_counter() - start)
+                        first_event = False
+                    if event.type == "text" and on_text:
+                        on_text(event.text)
+                    elif event.type == "content_block_stop" and on_tool_use and \
+                            isinstance(event.content_block, BetaToolUseBlock):
+                        on_tool_use(event.content_block)
+                response = await stream.get_final_message()
+            metrics.record('api', time.perf_counter() - start)
+            return self.handle_response(response)
+
+        except anthropic.APIError as e:
+            raise Exception(f"API Error: {str(e)}")
+        except Exception as e:
+            raise Exception(f"Unexpected error: {str(e)}")
+
+    def prune_screenshots(self, history, keep_last, batch=1, pending=0):
+        """Replace old images in tool results with a text placeholder, keeping at least the last `keep_last`.
+
+        Images are dropped `batch` at a time, so between `keep_last` and `keep_last + batch - 1`
+        are kept. Dropping more changes the prefix cached at the previous step's breakpoint,
+        with batching that happens once every `batch` images instead of on every step.
+
+        The original history is left untouched, pruned messages are shallow copies so the
+        tool_use/tool_result pairing stays valid. `pending` images that aren't in the history
+        yet are counted as the newest ones. Returns (history, dropped_images, dropped_bytes).
+        """
+        if keep_last is None or keep_last < 0:
+            return history, 0, 0
+
+        # Find the positions of every image block inside tool results, oldest first
+        image_positions = []
+        for i, message in enumerate(history):
+            content = message.get("content")
+            if message.get("role") != "user" or not isinstance(content, list):
+                continue
+            for j, block in enumerate(content):
+                if isinstance(block, dict) and block.get("type") == "tool_result":
+                    for k, inner in enumerate(block.get("content") or []):
+                        if isinstance(inner, dict) and inner.get("type") == "image":
+                            image_positions.append((i, j, k))
+
+        excess = max(len(image_positions) + pending - keep_last, 0)
+        to_drop = image_positions[:excess - excess % max(batch, 1)]
+        if not to_drop:
+            return history, 0, 0
+
+        pruned = list(history)
+        dropped_bytes = 0
+        for i, j, k in to_drop:
+            # Copy each level we modify so run_history keeps the full screenshots
+            if pruned[i] is history[i]:
+                pruned[i] = {**history[i], "content": list(history[i]["content"])}
+            block = pruned[i]["content"][j]
+            if block is history[i]["content"][j]:
+                block = {**block, "content": list(block["content"])}
+                pruned[i]["content"][j] = block
+            image = block["content"][k]
+            dropped_bytes += image_source_size(image.get("source", {}))
+            block["content"][k] = {"type": "text", "text": SCREENSHOT_PLACEHOLDER}
+
+        return pruned, len(to_drop), dropped_bytes
+
+    def add_cache_breakpoint(self, history):
+        """Mark the last block of the latest message as a prompt-cache breakpoint.
+
+        Only a copy of that message is changed, so breakpoints don't pile up in run_history
+        (the API allows at most 4 per request, two of which are used by tools and system).
+        """
+        if not history:
+            return history
+
+        last = history[-1]
+        content = last.get("content")
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        elif isinstance(content, list) and content and isinstance(content[-1], dict):
+            content = list(content)
+        else:
+            return history
+
+        content[-1] = {**content[-1], "cache_control": CACHE_CONTROL}
+        return history[:-1] + [{**last, "content": content}]
@@ -0,0 +1,421 @@
+"""Headless benchmark of the agent loop against a local mock of the Messages API.
+
+Drives Store.run_agent without Qt. A local server replays scripted tool calls with fixed
+delays, so everything apart from that delay is the loop's own overhead (capture, encode,
+history handling, request building). Run with `python benchmark.py --help`.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image, ImageDraw
+from .config import ConfigService
+from .metrics import get_metrics, percentile
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, max RSS isn't reported there
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STEPS = 20
+DEFAULT_DELAY = 0.5  # Seconds before the mock server sends the first byte of a response
+DEFAULT_CHUNK_DELAY = 0.01  # Seconds between streamed events
+DEFAULT_SCREEN_SIZE = (2560, 1600)
+DEFAULT_DISPLAY_NUMBER = 99
+# Cycled through by the default script, one computer action per step
+DEFAULT_ACTIONS = [
+    {"action": "screenshot"},
+    {"action": "mouse_move", "coordinate": [640, 400]},
+    {"action": "left_click"},
+    {"action": "type", "text": "The quick brown fox jumps over the lazy dog"},
+    {"action": "key", "text": "enter"},
+    {"action": "mouse_move", "coordinate": [200, 150]},
+    {"action": "double_click"},
+]
+FINISH_STEP = [{"type": "tool_use", "name": "finish_run", "input": {}}]
+MOCK_USAGE = {"input_tokens": 1000, "output_tokens": 50,
+              "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+# Used instead of the user's config.json, so nothing is journaled, replayed or served from a cache
+BENCHMARK_CONFIG = {
+    'journal_enabled': False,
+    'record_macros': False,
+    'replay_macros': False,
+    'response_cache_enabled': False,
+}
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt".split()
+
+
+def default_script(steps):
+    """`steps` steps of one text block and one computer action each, then finish_run"""
+    script = []
+    for i in range(steps):
+        script.append([
+            {"type": "text", "text": f"I have evaluated step {i}, next I will do step {i + 1}."},
+            {"type": "tool_use", "name": "computer", "input": DEFAULT_ACTIONS[i % len(DEFAULT_ACTIONS)]},
+        ])
+    return script + [FINISH_STEP]
+
+
+class MockMessagesServer(ThreadingHTTPServer):
+    """Local stand-in for the Messages API that answers with a script of content blocks.
+
+    Request number N gets step N of the script (the last step is repeated once the script
+    runs out). Every request is recorded with its arrival time, the time the response was
+    fully sent, the request body size and the number of images in it.
+    """
+    daemon_threads = True
+
+    def __init__(self, script, delay=DEFAULT_DELAY, chunk_delay=DEFAULT_CHUNK_DELAY, port=0):
+        super().__init__(('127.0.0.1', port), MockMessagesHandler)
+        self.script = script
+        self.delay = delay
+        self.chunk_delay = chunk_delay
+        self.requests = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def next_step(self, record):
+        with self.lock:
+            index = len(self.requests)
+            self.requests.append(record)
+        blocks = self.script[min(index, len(self.script) - 1)]
+        content = []
+        for j, block in enumerate(blocks):
+            if block["type"] == "tool_use":
+                block = {**block, "id": f"toolu_bench_{index}_{j}"}
+            content.append(block)
+        return index, content
+
+
+class MockMessagesHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, so connection reuse is measured too
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_GET(self):
+        # Only models.list is used, for connection warm-up
+        self.send_json({"data": [], "has_more": False, "first_id": None, "last_id": None})
+
+    def do_POST(self):
+        arrived = time.perf_counter()
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        request = json.loads(body)
+        record = {'arrived': arrived, 'bytes': len(body), 'images': count_images(request.get('messages', []))}
+        index, content = self.server.next_step(record)
+        message = {
+            "id": f"msg_bench_{index}", "type": "message", "role": "assistant", "model": request.get("model"),
+            "content": content, "stop_sequence": None, "usage": MOCK_USAGE,
+            "stop_reason": "tool_use" if any(block["type"] == "tool_use" for block in content) else "end_turn",
+        }
+
+        time.sleep(self.server.delay)
+        if request.get("stream"):
+            self.send_stream(message)
+        else:
+            self.send_json(message)
+        record['responded'] = time.perf_counter()
+
+    def send_json(self, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_stream(self, message):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self.send_event('message_start', {"type": "message_start", "message": {
+            **message, "content": [], "stop_reason": None, "usage": {**MOCK_USAGE, "output_tokens": 1}}})
+        for index, block in enumerate(message["content"]):
+            if block["type"] == "text":
+                self.send_event('content_block_start', {"type": "content_block_start", "index": index,
+                                                        "content_block": {"type": "text", "text": ""}})
+                for chunk in split_chunks(block["text"]):
+                    self.send_event('content_block_delta', {"type": "content_block_delta", "index": index,
+                                                            "delta": {"type": "text_delta", "text": chunk}})
+            else:
+                self.send_event('content_block_start', {"type": "content_block_start", "index": index,
+                                                        "content_block": {**block, "input": {}}})
+                for chunk in split_chunks(json.dumps(block["input"])):
+                    self.send_event('content_block_delta', {"type": "content_block_delta", "index": index,
+                                                            "delta": {"type": "input_json_delta", "partial_json": chunk}})
+            self.send_event('content_block_stop', {"type": "content_block_stop", "index": index})
+        self.send_event('message_delta', {"type": "message_delta", "usage": {"output_tokens": MOCK_USAGE["output_tokens"]},
+                                          "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None}})
+        self.send_event('message_stop', {"type": "message_stop"})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def send_event(self, event, payload):
+        data = f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode('utf-8')
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+        time.sleep(self.server.chunk_delay)
+
+
+def split_chunks(text, count=3):
+    size = max(len(text) // count, 1)
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+def count_images(messages):
+    count = 0
+    for message in messages:
+        content = message.get("content")
+        if not isinstance(content, list):
+            continue
+        for block in content:
+            if block.get("type") == "image":
+                count += 1
+            elif block.get("type") == "tool_result" and isinstance(block.get("content"), list):
+                count += sum(1 for item in block["content"] if item.get("type") == "image")
+    return count
+
+
+def start_xvfb(display_number, size):
+    """Start a virtual X display and point DISPLAY at it, returns the process"""
+    if shutil.which('Xvfb') is None:
+        raise RuntimeError("Xvfb not found, install it or use --computer fake without --xvfb on a desktop")
+    process = subprocess.Popen(['Xvfb', f':{display_number}', '-screen', '0', f'{size[0]}x{size[1]}x24', '-nolisten', 'tcp'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    socket_path = f'/tmp/.X11-unix/X{display_number}'
+    deadline = time.monotonic() + 10
+    while not os.path.exists(socket_path):
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            raise RuntimeError(f"Xvfb failed to start on display :{display_number}")
+        time.sleep(0.05)
+    os.environ['DISPLAY'] = f':{display_number}'
+    return process
+
+
+def make_fake_computer_control(size, config_service):
+    """ComputerControl on a generated screen, with no real mouse, keyboard or display capture"""
+    from .capture import CaptureBackend
+    from .computer import ComputerControl, NO_SETTLE_ACTIONS
+
+    class SyntheticCaptureBackend(CaptureBackend):
+        """A generated desktop full of text that actions draw on"""
+        name = 'synthetic'
+
+        def __init__(self, size):
+            self.size = size
+            self.random = random.Random(0)
+            super().__init__(0)
+            self.image = Image.new('RGB', size, (245, 245, 245))
+            draw = ImageDraw.Draw(self.image)
+            draw.rectangle((0, 0, size[0], 60), fill=(40, 44, 52))
+            draw.rectangle((0, 60, 300, size[1]), fill=(225, 228, 232))
+            for y in range(80, size[1], 18):
+                draw.text((320, y), ' '.join(self.random.choices(WORDS, k=20)), fill=(30, 30, 30))
+            self.cursor = (0, 0)
+
+        def _find_monitor(self):
+            return {'left': 0, 'top': 0, 'width': self.size[0], 'height': self.size[1]}
+
+        def _grab(self):
+            return self.image.copy()
+
+        def apply_action(self, action):
+            draw = ImageDraw.Draw(self.image)
+            x, y = self.cursor
+            if action['type'] in ('mouse_move', 'left_click_drag'):
+                self.cursor = (int(action['x'] * self.size[0] / 1280), int(action['y'] * self.size[1] / 800))
+            elif action['type'] in ('left_click', 'double_click', 'right_click', 'middle_click'):
+                # Open a "menu" next to the cursor
+                draw.rectangle((x, y, x + 400, y + 300), fill=(255, 255, 255), outline=(120, 120, 120))
+                for i in range(10):
+                    draw.text((x + 10, y + 10 + i * 28), self.random.choice(WORDS).title(), fill=(0, 0, 0))
+            elif action['type'] == 'type':
+                draw.rectangle((320, 70, self.size[0] - 20, 100), fill=(255, 255, 255), outline=(0, 120, 215))
+                draw.text((330, 78), action['text'], fill=(0, 0, 0))
+            elif action['type'] == 'key':
+                # Scroll the content, a change over most of the screen
+                content = self.image.crop((300, 100, self.size[0], self.size[1]))
+                self.image.paste(content, (300, 60))
+
+    class FakeComputerControl(ComputerControl):
+        def apply_config(self, config):
+            if self.capture_backend is None:
+                self.capture_backend = SyntheticCaptureBackend(size)
+                self.capture_backend_name = self.capture_backend.name
+                self.screen_index = 0
+            super().apply_config({**config, 'capture_backend': self.capture_backend.name, 'screen_index': 0})
+
+        def perform_action(self, action):
+            self.refresh_config()
+            self.settled_frame = None
+            action_type = action['type']
+            if action_type == 'screenshot':
+                return self.take_screenshot(dedup=True)
+            if action_type == 'cursor_position':
+                return self.map_to_ai_space(*self.capture_backend.cursor)
+
+            settle = self.settle_timeout > 0 and action_type not in NO_SETTLE_ACTIONS
+            self.last_checkpoint = None
+            if settle or self.record_checkpoints:
+                before_hash = self.last_checkpoint = self.screen_hash()
+            with get_metrics().span('action'):
+                self.capture_backend.apply_action(action)
+            if settle:
+                self.wait_for_settle(before_hash)
+            return 'keys' if action_type == 'type' else None
+
+    return FakeComputerControl(config_service)
+
+
+def make_config_service(directory, path=None):
+    """ConfigService for BENCHMARK_CONFIG plus the settings in `path`, written to `directory`"""
+    config = dict(BENCHMARK_CONFIG)
+    if path:
+        with open(path, 'r') as f:
+            config.update(json.load(f))
+    config_path = os.path.join(directory, 'config.json')
+    with open(config_path, 'w') as f:
+        json.dump(config, f)
+    return ConfigService(config_path)
+
+
+def run_benchmark(args):
+    script = default_script(args.steps)
+    if args.script:
+        with open(args.script, 'r') as f:
+            script = json.load(f)
+    with tempfile.TemporaryDirectory() as directory:
+        return _run_benchmark(args, script, make_config_service(directory, args.config))
+
+
+def _run_benchmark(args, script, config_service):
+
+    server = MockMessagesServer(script, delay=args.delay, chunk_delay=args.chunk_delay)
+    threading.Thread(target=server.serve_forever, name='mock-api', daemon=True).start()
+    os.environ['ANTHROPIC_BASE_URL'] = server.url
+    os.environ.setdefault('ANTHROPIC_API_KEY', 'benchmark')
+
+    # Imported late, the real ComputerControl's capture backends read DISPLAY on import
+    from .store import Store
+    computer_control = make_fake_computer_control(tuple(args.screen_size), config_service) \
+        if args.computer == 'fake' else None
+    store = Store(computer_control=computer_control, config_service=config_service)
+    if store.error:
+        raise RuntimeError(store.error)
+    store.set_instructions(args.instructions)
+
+    errors = []
+
+    def on_update(message):
+        if message.startswith("Error:"):
+            errors.append(message)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    start = time.perf_counter()
+    store.run_agent(on_update)
+    end = time.perf_counter()
+    python_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+    if args.tracemalloc:
+        tracemalloc.stop()
+    server.shutdown()
+
+    steps = []
+    requests = server.requests
+    for i, record in enumerate(requests):
+        next_arrival = requests[i + 1]['arrived'] if i + 1 < len(requests) else end
+        steps.append({
+            'step': i,
+            'wall': next_arrival - record['arrived'],
+            # Everything after the response was received until the next request was sent
+            'overhead': next_arrival - record.get('responded', next_arrival),
+            'bytes': record['bytes'],
+            'images': record['images'],
+        })
+    max_rss = None
+    if resource is not None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        max_rss *= 1 if sys.platform == 'darwin' else 1024  # Bytes on macOS, KiB elsewhere
+    overheads = [step['overhead'] for step in steps]
+    return {
+        'computer': args.computer,
+        'steps': steps,
+        'total_time': end - start,
+        'total_overhead': sum(overheads),
+        'overhead_p50': percentile(overheads, 0.5),
+        'overhead_p95': percentile(overheads, 0.95),
+        'bytes_uploaded': sum(step['bytes'] for step in steps),
+        'max_rss': max_rss,
+        'python_peak': python_peak,
+        'errors': errors,
+        'stages': get_metrics().run_summary(),
+    }
+
+
+def print_report(results):
+    print(f"{'step':>4} {'wall ms':>9} {'overhead ms':>12} {'upload KB':>10} {'images':>6}")
+    for step in results['steps']:
+        print(f"{step['step']:>4} {step['wall'] * 1000:>9.1f} {step['overhead'] * 1000:>12.1f} "
+              f"{step['bytes'] / 1024:>10.1f} {step['images']:>6}")
+    print(f"\nTotal time:      {results['total_time']:.2f} s over {len(results['steps'])} requests")
+    print(f"Agent overhead:  {results['total_overhead']:.2f} s "
+          f"(p50 {results['overhead_p50'] * 1000:.1f} ms, p95 {results['overhead_p95'] * 1000:.1f} ms per step)")
+    print(f"Bytes uploaded:  {results['bytes_uploaded'] / 1024:.1f} KB")
+    if results['max_rss'] is not None:
+        print(f"Max RSS:         {results['max_rss'] / 2 ** 20:.1f} MB")
+    if results['python_peak'] is not None:
+        print(f"Python peak:     {results['python_peak'] / 2 ** 20:.1f} MB (tracemalloc)")
+    print(f"\n{results['stages']}")
+    for error in results['errors']:
+        print(error)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the agent loop against a mock Messages API")
+    parser.add_argument('--steps', type=int, default=DEFAULT_STEPS, help="Steps in the default script")
+    parser.add_argument('--script', help="JSON file with a list of steps, each a list of content blocks")
+    parser.add_argument('--delay', type=float, default=DEFAULT_DELAY, help="Mock time to first byte, seconds")
+    parser.add_argument('--chunk-delay', type=float, default=DEFAULT_CHUNK_DELAY, help="Delay between streamed events")
+    parser.add_argument('--computer', choices=('fake', 'real'), default='fake',
+                        help="Generated screen with no real input, or the real ComputerControl")
+    parser.add_argument('--screen-size', type=int, nargs=2, default=DEFAULT_SCREEN_SIZE, metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--xvfb', action='store_true', help="Run on a virtual X display")
+    parser.add_argument('--display-number', type=int, default=DEFAULT_DISPLAY_NUMBER)
+    parser.add_argument('--tracemalloc', action='store_true', help="Also report peak Python allocations (slower)")
+    parser.add_argument('--instructions', default="Benchmark run")
+    parser.add_argument('--config', help="JSON file with settings to benchmark, config.json is not read")
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    xvfb = start_xvfb(args.display_number, args.screen_size) if args.xvfb else None
+    try:
+        results = run_benchmark(args)
+    finally:
+        if xvfb is not None:
+            xvfb.terminate()
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 1 if results['errors'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+import logging
+import threading
+import time
+from PIL import Image
+from .metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAPTURE_BACKEND = 'mss'
+# Seconds to wait for the GUI thread to grab the screen for the Qt backend
+QT_GRAB_TIMEOUT = 5.0
+
+
+class CaptureBackend:
+    """Long-lived screen capture for a single monitor.
+
+    Subclasses look up the monitor geometry once and implement `_grab`, which returns a PIL
+    RGB image of that monitor. `capture` records how long each grab took, under `stage`.
+    """
+    name = 'base'
+
+    def __init__(self, screen_index=0):
+        self.screen_index = screen_index
+        self.last_latency = None  # Seconds taken by the most recent capture
+        self.last_captured_at = None  # Wall clock time of the most recent capture
+        self.monitor = self._find_monitor()  # {'left', 'top', 'width', 'height'}
+
+    def _find_monitor(self):
+        raise NotImplementedError
+
+    def _grab(self):
+        raise NotImplementedError
+
+    def capture(self, stage='capture'):
+        start = time.perf_counter()
+        self.last_captured_at = time.time()
+        screenshot = self._grab()
+        self.last_latency = time.perf_counter() - start
+        get_metrics().record(stage, self.last_latency)
+        logger.debug("Captured screen with %s in %.1f ms", self.name, self.last_latency * 1000)
+        return screenshot
+
+    def close(self):
+        pass
+
+
+class MssCaptureBackend(CaptureBackend):
+    name = 'mss'
+
+    def __init__(self, screen_index=0):
+        import mss
+        self._mss = mss
+        # mss handles can't be shared across threads (X11/GDI), so keep one per thread
+        self._local = threading.local()
+        super().__init__(screen_index)
+
+    def _session(self):
+        sct = getattr(self._local, 'sct', None)
+        if sct is None:
+            sct = self._local.sct = self._mss.mss()
+        return sct
+
+    def _find_monitor(self):
+        # A short-lived handle, the backend may be created on a thread that never grabs
+        with self._mss.mss() as sct:
+            monitors = sct.monitors[1:]  # Skip the "all monitors" monitor
+        if self.screen_index >= len(monitors):
+            logger.warning("Screen %s not found, using primary monitor", self.screen_index)
+            return dict(monitors[0])
+        return dict(monitors[self.screen_index])
+
+    def _grab(self):
+        shot = self._session().grab(self.monitor)
+        return Image.frombytes('RGB', shot.size, shot.rgb)
+
+    def close(self):
+        sct = getattr(self._local, 'sct', None)
+        if sct is not None:
+            sct.close()
+            self._local.sct = None
+
+
+class PyAutoGuiCaptureBackend(CaptureBackend):
+    name = 'pyautogui'
+
+    def __init__(self, screen_index=0):
+        import pyautogui
+        self._pyautogui = pyautogui
+        super().__init__(screen_index)
+
+    def _find_monitor(self):
+        # pyautogui has no notion of monitors, so restrict to the primary screen
+        width, height = self._pyautogui.size()
+        return {'left': 0, 'top': 0, 'width': width, 'height': height}
+
+    def _grab(self):
+        region = (self.monitor['left'], self.monitor['top'], self.monitor['width'], self.monitor['height'])
+        return self._pyautogui.screenshot(region=region).convert('RGB')
+
+
+class QtCaptureBackend(CaptureBackend):
+    """Capture through QScreen.grabWindow.
+
+    grabWindow creates a QPixmap, which is only allowed on the GUI thread. Grabs from other
+    threads (i.e. the computer thread) are queued to the GUI thread and waited for.
+    """
+    name = 'qt'
+
+    def __init__(self, screen_index=0):
+        from PyQt6.QtCore import QObject, QThread, pyqtSignal, pyqtSlot
+        from PyQt6.QtGui import QGuiApplication
+        self._app = QGuiApplication.instance()
+        if self._app is None:
+            raise RuntimeError("Qt capture backend requires a running QApplication")
+        self._current_thread = QThread.currentThread
+        grab_image = self._grab_image
+
+        class Grabber(QObject):
+            requested = pyqtSignal(object)
+
+            @pyqtSlot(object)
+            def grab(self, request):
+                try:
+                    request['image'] = grab_image()
+                except Exception as e:
+                    request['error'] = e
+                request['done'].set()
+
+        # Lives on the GUI thread, so `requested` emitted from another thread is queued there
+        self._grabber = Grabber()
+        self._grabber.moveToThread(self._app.thread())
+        self._grabber.requested.connect(self._grabber.grab)
+        super().__init__(screen_index)
+
+    def _find_monitor(self):
+        screens = self._app.screens()
+        if self.screen_index >= len(screens):
+            logger.warning("Screen %s not found, using primary monitor", self.screen_index)
+            self.screen = self._app.primaryScreen()
+        else:
+            self.screen = screens[self.screen_index]
+        geometry = self.screen.geometry()
+        return {'left': geometry.x(), 'top': geometry.y(),
+                'width': geometry.width(), 'height': geometry.height()}
+
+    def _grab_image(self):
+        """QImage of the screen, must be called on the GUI thread"""
+        from PyQt6.QtGui import QImage
+        return self.screen.grabWindow(0).toImage().convertToFormat(QImage.Format.Format_RGB888)
+
+    def _grab(self):
+        if self._current_thread() == self._app.thread():
+            image = self._grab_image()
+        else:
+            request = {'done': threading.Event()}
+            self._grabber.requested.emit(request)
+            # With a timeout, the GUI thread may be busy or already shut down when quitting
+            if not request['done'].wait(QT_GRAB_TIMEOUT):
+                raise RuntimeError(f"GUI thread did not grab the screen within {QT_GRAB_TIMEOUT}s")
+            if 'error' in request:
+                raise request['error']
+            image = request['image']
+        width, height = image.width(), image.height()
+        data = image.constBits().asstring(image.sizeInBytes())
+        return Image.frombuffer('RGB', (width, height), data, 'raw', 'RGB', image.bytesPerLine(), 1)
+
+
+CAPTURE_BACKENDS = {
+    'mss': MssCaptureBackend,
+    'pyautogui': PyAutoGuiCaptureBackend,
+    'qt': QtCaptureBackend,
+}
+
+
+def create_capture_backend(name=DEFAULT_CAPTURE_BACKEND, screen_index=0):
+    """Create the requested capture backend, falling back to pyautogui if it's unavailable"""
+    backend_class = CAPTURE_BACKENDS.get(name)
+    if backend_class is None:
+        raise ValueError(f"Unknown capture backend: {name}")
+    try:
+        backend = backend_class(screen_index)
+    except Exception as e:
+        if backend_class is PyAutoGuiCaptureBackend:
+            raise
+        logger.warning("Capture backend '%s' unavailable (%s), falling back to pyautogui", name, e)
+        backend = PyAutoGuiCaptureBackend(screen_index)
+    logger.info("Using capture backend '%s' for monitor %s", backend.name, backend.monitor)
+    return backend
@@ -1,120 +1,426 @@
-import pyautogui
 from PIL import Image
-import io
-import base64
+import numpy as np
 import time
-import json
-import os
+import logging
+import sys
+from .config import get_config_service
+from .capture import create_capture_backend, DEFAULT_CAPTURE_BACKEND
+from .encoder import ScreenshotEncoder
+from .frame import Frame
+from .metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyperclip
+except ImportError:
+    # Without clipboard access text is always typed key by key
+    pyperclip = None
+
+pyautogui = None  # Imported by load_pyautogui, importing it needs a display on Linux
+
+# Resolution of the difference hash used to detect unchanged screens
+HASH_WIDTH, HASH_HEIGHT = 128, 80
+RESIZE_FILTERS = {
+    'nearest': Image.Resampling.NEAREST,
+    'box': Image.Resampling.BOX,
+    'bilinear': Image.Resampling.BILINEAR,
+    'hamming': Image.Resampling.HAMMING,
+    'bicubic': Image.Resampling.BICUBIC,
+    'lanczos': Image.Resampling.LANCZOS,
+}
+DEFAULT_RESIZE_FILTER = 'bilinear'
+# Actions whose perform_action result is a screenshot taken after the action
+OBSERVATION_ACTIONS = {'screenshot'}
+# Max number of differing hash bits for a frame to count as unchanged, -1 disables dedup
+DEFAULT_DEDUP_THRESHOLD = 0
+# Actions that don't change the screen, so there's nothing to wait for afterwards
+NO_SETTLE_ACTIONS = {'screenshot', 'cursor_position'}
+# Settle detection: after an action, sample the screen every `interval` seconds until
+# `stable_frames` consecutive frames match, giving up after `timeout` seconds (0 disables).
+# If nothing has changed yet, wait at least `min_delay` for the UI to start reacting.
+DEFAULT_SETTLE_TIMEOUT = 3.0
+DEFAULT_SETTLE_INTERVAL = 0.05
+DEFAULT_SETTLE_STABLE_FRAMES = 3
+DEFAULT_SETTLE_MIN_DELAY = 0.3
+# Changed-region crops: when only a small part of the screen changed since the last full
+# frame sent, send just that region. A full frame is sent when the region covers more than
+# `crop_max_area` of the screen or after `crop_full_frame_every` crops in a row.
+DEFAULT_CROP_MAX_AREA = 0.25
+DEFAULT_CROP_FULL_FRAME_EVERY = 5
+CROP_PIXEL_TOLERANCE = 8  # Ignore small color differences from resampling and compression
+CROP_MARGIN = 16  # Extra pixels around the changed region for context
+# How the 'type' action enters text, see ComputerControl.type_text
+TYPING_STRATEGIES = ('auto', 'paste', 'keys', 'per_key')
+DEFAULT_TYPING_STRATEGY = 'auto'
+DEFAULT_PASTE_MIN_LENGTH = 10
+DEFAULT_TYPING_CHUNK_SIZE = 200
+TYPING_CHUNK_PAUSE = 0.05
+DEFAULT_TYPING_INTERVAL = 0.05
+# With settle detection off there's no way to see the paste land, the previous clipboard is
+# restored after this many seconds instead
+PASTE_RESTORE_DELAY = 1.0
+# type_text result when the paste couldn't be seen on screen and wasn't typed again
+UNCONFIRMED_PASTE = 'paste_unconfirmed'
+# pyautogui's delay after every call. Settle detection already waits for the screen, without
+# it the pause gives the UI time to react before the next action.
+DEFAULT_ACTION_PAUSE = 0.0
+DEFAULT_UNSETTLED_ACTION_PAUSE = 0.5
+
+def load_pyautogui():
+    """Import pyautogui on first use, so ComputerControl subclasses that don't use it run headless"""
+    global pyautogui
+    if pyautogui is None:
+        import pyautogui as module
+        pyautogui = module
+    return pyautogui
+
 
 class ComputerControl:
-    def __init__(self):
+    def __init__(self, config_service=None):
         # Get the selected screen from config
         self.screen_index = 0  # Default to primary screen
-        self.load_screen_config()
-        
-        # Get screen info
-        self.screens = pyautogui.screenshot().size  # Fallback to full desktop size
-        try:
-            import tkinter as tk
-            root = tk.Tk()
-            root.withdraw()  # Hide the window
-            
-            # Get all screens
-            screens = root.winfo_screenwidth(), root.winfo_screenheight()
-            if hasattr(root, 'winfo_screens'):  # Check if multiple screen info is available
-                screen_names = root.winfo_screens()
-                if self.screen_index < len(screen_names):
-                    screen = root.winfo_screen(screen_names[self.screen_index])
-                    self.screen_x = screen.winfo_x()
-                    self.screen_y = screen.winfo_y()
-                    self.screen_width = screen.winfo_width()
-                    self.screen_height = screen.winfo_height()
-            else:
-                # Fallback to primary screen
-                self.screen_x = 0
-                self.screen_y = 0
-                self.screen_width = root.winfo_screenwidth()
-                self.screen_height = root.winfo_screenheight()
-            
-            root.destroy()
-        except Exception as e:
-            # Fallback to full desktop size if tkinter fails
-            self.screen_x = 0
-            self.screen_y = 0
-            self.screen_width, self.screen_height = self.screens
-            
-        pyautogui.PAUSE = 0.5  # Add a small delay between actions for stability
-        
-    def load_screen_config(self):
+        self.dedup_threshold = DEFAULT_DEDUP_THRESHOLD
+        self.capture_backend_name = DEFAULT_CAPTURE_BACKEND
+        self.capture_backend = None
+        self.encoder = ScreenshotEncoder()
+        self.resize_filter = RESIZE_FILTERS[DEFAULT_RESIZE_FILTER]
+        self.settle_timeout = DEFAULT_SETTLE_TIMEOUT
+        self.settle_interval = DEFAULT_SETTLE_INTERVAL
+        self.settle_stable_frames = DEFAULT_SETTLE_STABLE_FRAMES
+        self.settle_min_delay = DEFAULT_SETTLE_MIN_DELAY
+        self.typing_strategy = DEFAULT_TYPING_STRATEGY
+        self.paste_min_length = DEFAULT_PASTE_MIN_LENGTH
+        self.typing_chunk_size = DEFAULT_TYPING_CHUNK_SIZE
+        self.typing_interval = DEFAULT_TYPING_INTERVAL
+        self.crop_changes = False
+        self.crop_max_area = DEFAULT_CROP_MAX_AREA
+        self.crop_full_frame_every = DEFAULT_CROP_FULL_FRAME_EVERY
+        self.max_screenshots = None
+        self.action_pause = DEFAULT_ACTION_PAUSE
+        self.last_sent_hash = None  # Hash of the last screenshot sent to the model
+        self.last_observation_hash = None  # Hash of the screen at the last observation, even if not resent
+        self.last_full_frame = None  # AI-space pixels of the last full frame sent, for crops
+        self.crops_since_full_frame = 0
+        self.settled_frame = None  # Last frame sampled while settling, reused by take_screenshot
+        self.settled_frame_time = None
+        self.last_settle_time = None  # Seconds spent waiting for the screen after the last action
+        self.record_checkpoints = False  # Keep the pre-action hash even when not settling
+        self.last_checkpoint = None  # Hash of the screen right before the last action
+        self.pending_config = None  # Config saved while running, applied before the next action
+        self.config_service = config_service or get_config_service()
+        self.apply_config(self.config_service.config)
+        self.config_service.subscribe(self.on_config_changed)
+        self.pending_config = None  # Already applied above
+        self.detect_screen_geometry()
+
+    def detect_screen_geometry(self):
+        """Map AI coordinates onto the monitor the capture backend grabs"""
+        monitor = self.capture_backend.monitor
+        self.screen_x, self.screen_y = monitor['left'], monitor['top']
+        self.screen_width, self.screen_height = monitor['width'], monitor['height']
+
+    def on_config_changed(self, config):
+        # May be called from the GUI thread, so only apply it on the thread doing the actions
+        self.pending_config = config
+
+    def refresh_config(self):
+        """Apply config.json changes saved since the last action"""
+        self.config_service.check()
+        config, self.pending_config = self.pending_config, None
+        if config is not None:
+            self.apply_config(config)
+
+    def apply_config(self, config):
         try:
-            if os.path.exists('config.json'):
-                with open('config.json', 'r') as f:
-                    config = json.load(f)
-                    self.screen_index = config.get('screen_index', 0)
+            screen_index = config.get('screen_index', 0)
+            capture_backend_name = config.get('capture_backend', DEFAULT_CAPTURE_BACKEND)
+            self.dedup_threshold = config.get('screenshot_dedup_threshold', DEFAULT_DEDUP_THRESHOLD)
+            self.encoder = ScreenshotEncoder.from_config(config)
+            self.resize_filter = RESIZE_FILTERS[config.get('resize_filter', DEFAULT_RESIZE_FILTER)]
+            self.settle_timeout = config.get('settle_timeout', DEFAULT_SETTLE_TIMEOUT)
+            self.settle_interval = config.get('settle_interval', DEFAULT_SETTLE_INTERVAL)
+            self.settle_stable_frames = config.get('settle_stable_frames', DEFAULT_SETTLE_STABLE_FRAMES)
+            self.settle_min_delay = config.get('settle_min_delay', DEFAULT_SETTLE_MIN_DELAY)
+            default_pause = DEFAULT_ACTION_PAUSE if self.settle_timeout > 0 else DEFAULT_UNSETTLED_ACTION_PAUSE
+            self.action_pause = config.get('action_pause', default_pause)
+            self.typing_strategy = config.get('typing_strategy', DEFAULT_TYPING_STRATEGY)
+            if self.typing_strategy not in TYPING_STRATEGIES:
+                raise ValueError(f"Unsupported typing strategy: {self.typing_strategy}")
+            self.paste_min_length = config.get('paste_min_length', DEFAULT_PASTE_MIN_LENGTH)
+            self.typing_chunk_size = config.get('typing_chunk_size', DEFAULT_TYPING_CHUNK_SIZE)
+            self.typing_interval = config.get('typing_interval', DEFAULT_TYPING_INTERVAL)
+            self.crop_changes = config.get('crop_changes', False)
+            self.crop_max_area = config.get('crop_max_area', DEFAULT_CROP_MAX_AREA)
+            self.crop_full_frame_every = config.get('crop_full_frame_every', DEFAULT_CROP_FULL_FRAME_EVERY)
+            self.max_screenshots = config.get('max_screenshots_in_history')
         except Exception as e:
-            print(f"Error loading screen config: {e}")
-            self.screen_index = 0
+            logger.error("Error loading screen config: %s", e)
+            return
+
+        if self.capture_backend is None:
+            # Created once and reused for every screenshot
+            self.screen_index = screen_index
+            self.capture_backend_name = capture_backend_name
+            self.capture_backend = create_capture_backend(capture_backend_name, screen_index)
+        elif screen_index != self.screen_index or capture_backend_name != self.capture_backend_name:
+            self.screen_index = screen_index
+            self.capture_backend_name = capture_backend_name
+            self.capture_backend.close()
+            self.capture_backend = create_capture_backend(capture_backend_name, screen_index)
+            self.detect_screen_geometry()
         
     def perform_action(self, action):
+        self.refresh_config()
+        load_pyautogui().PAUSE = self.action_pause
+        self.settled_frame = None
         action_type = action['type']
+
+        settle = self.settle_timeout > 0 and action_type not in NO_SETTLE_ACTIONS
+        result = None
+        self.last_checkpoint = None
+        if settle or (self.record_checkpoints and action_type not in NO_SETTLE_ACTIONS):
+            before_hash = self.last_checkpoint = self.screen_hash()
         
+        start = time.perf_counter()
         if action_type == 'mouse_move':
             x, y = self.map_from_ai_space(action['x'], action['y'])
             pyautogui.moveTo(x, y)
         elif action_type == 'left_click':
             pyautogui.click()
-            time.sleep(0.1)  # Add a small delay after clicking
         elif action_type == 'right_click':
             pyautogui.rightClick()
-            time.sleep(0.1)
         elif action_type == 'middle_click':
             pyautogui.middleClick()
-            time.sleep(0.1)
         elif action_type == 'double_click':
             pyautogui.doubleClick()
-            time.sleep(0.1)
         elif action_type == 'left_click_drag':
             start_x, start_y = pyautogui.position()
             end_x, end_y = self.map_from_ai_space(action['x'], action['y'])
             pyautogui.dragTo(end_x, end_y, button='left', duration=0.5)
         elif action_type == 'type':
-            pyautogui.write(action['text'], interval=0.1)  # Add a small delay between keystrokes
+            result = self.type_text(action['text'])
         elif action_type == 'key':
             pyautogui.press(action['text'])
-            time.sleep(0.1)
         elif action_type == 'screenshot':
-            return self.take_screenshot()
+            # Deduped like the post-action screenshot, since the result is sent to the model
+            return self.take_screenshot(dedup=True)
         elif action_type == 'cursor_position':
             x, y = pyautogui.position()
             return self.map_to_ai_space(x, y)
         else:
             raise ValueError(f"Unsupported action: {action_type}")
-        
-    def take_screenshot(self):
-        """Take screenshot of the selected screen"""
+        get_metrics().record('action', time.perf_counter() - start)
+
+        if settle:
+            self.wait_for_settle(before_hash)
+        return result
+
+    def type_text(self, text):
+        """Enter text using the configured strategy and return the name of the one used
+
+        'paste' puts the text on the clipboard and sends the paste shortcut. If the clipboard or
+        the shortcut fails, the text is typed with 'keys' instead. If the screen doesn't change
+        within settle_timeout the shortcut was most likely ignored, and the text is typed with
+        'per_key'. Without settle detection (or for text that can't be typed) the paste can't
+        be checked, UNCONFIRMED_PASTE is returned so the model looks before typing it again.
+        'keys' sends zero-interval key presses in chunks, 'per_key' types one key at a time
+        like a person. 'auto' pastes text of at least paste_min_length characters (or any
+        non-ASCII text, which pyautogui can't type) and uses 'keys' otherwise. Text with
+        newlines, tabs or other control characters is never pasted by 'auto', pasting would
+        insert them literally instead of pressing the keys.
+        """
+        strategy = self.typing_strategy
+        if strategy == 'auto':
+            long_or_unicode = len(text) >= self.paste_min_length or not text.isascii()
+            pasteable = long_or_unicode and text.isprintable() and pyperclip is not None
+            strategy = 'paste' if pasteable else 'keys'
+
+        if strategy == 'paste':
+            pasted = self.paste_text(text) if pyperclip is not None else None
+            if pasted:
+                return 'paste'
+            if pasted is None:
+                logger.info("Could not paste, typing the text instead")
+                strategy = 'keys'
+            elif self.settle_timeout > 0 and text.isascii():
+                logger.info("Paste not visible after %ss, typing the text instead", self.settle_timeout)
+                strategy = 'per_key'
+            else:
+                return UNCONFIRMED_PASTE
+
+        if strategy == 'keys':
+            # Chunked so the target app's input queue can keep up with very long text
+            for i in range(0, len(text), self.typing_chunk_size):
+                pyautogui.write(text[i:i + self.typing_chunk_size], interval=0)
+                if i + self.typing_chunk_size < len(text):
+                    time.sleep(TYPING_CHUNK_PAUSE)
+            return 'keys'
+
+        pyautogui.write(text, interval=self.typing_interval)
+        return 'per_key'
+
+    def paste_text(self, text):
+        """Paste text through the clipboard and restore the previous clipboard afterwards
+
+        Returns True once the paste shows up on screen, False if it didn't within
+        settle_timeout (always False with settle detection off) and None if the clipboard
+        or the shortcut failed.
+        """
         try:
-            import mss
-            with mss.mss() as sct:
-                # Get all monitors
-                monitors = sct.monitors[1:]  # Skip the "all monitors" monitor
-                if self.screen_index < len(monitors):
-                    monitor = monitors[self.screen_index]
-                    # Take screenshot of just this monitor
-                    screenshot = sct.grab(monitor)
-                    # Convert to PIL Image
-                    from PIL import Image
-                    screenshot = Image.frombytes('RGB', screenshot.size, screenshot.rgb)
-                else:
-                    # Fallback to primary monitor if index is invalid
-                    screenshot = pyautogui.screenshot()
-        except ImportError:
-            # Fallback to pyautogui if mss is not available
-            screenshot = pyautogui.screenshot()
+            previous_clipboard = pyperclip.paste()
+            pyperclip.copy(text)
+        except pyperclip.PyperclipException as e:
+            logger.warning("Clipboard unavailable: %s", e)
+            return None
+
+        try:
+            before_hash = self.screen_hash() if self.settle_timeout > 0 else None
+            pyautogui.hotkey('command' if sys.platform == 'darwin' else 'ctrl', 'v')
+        except Exception as e:
+            logger.warning("Paste shortcut failed: %s", e)
+            pyperclip.copy(previous_clipboard)
+            return None
+
+        # The app reads the clipboard when it handles the shortcut (on X11 it asks the owner
+        # for the data then), so restore it only once the paste shows up on screen, or when
+        # giving up on it
+        if before_hash is None:
+            time.sleep(PASTE_RESTORE_DELAY)
+            pasted = False
+        else:
+            pasted = self.wait_for_change(before_hash, self.settle_timeout)
+        pyperclip.copy(previous_clipboard)
+        return pasted
+
+    def wait_for_change(self, before_hash, timeout):
+        """Poll the screen until it differs from `before_hash`, returns False after `timeout` seconds"""
+        deadline = time.perf_counter() + timeout
+        while self.hash_distance(self.screen_hash(), before_hash) == 0:
+            if time.perf_counter() >= deadline:
+                return False
+            time.sleep(self.settle_interval)
+        return True
+
+    def wait_for_settle(self, before_hash):
+        """Wait until the screen stops changing after an action, instead of sleeping a fixed time
+
+        Returns whether the screen changed compared to `before_hash`.
+        """
+        start = time.perf_counter()
+        deadline = start + self.settle_timeout
+        previous_hash = None
+        stable = 1
+        changed = False
+        while True:
+            frame = self.capture_backend.capture('settle_capture')
+            frame_hash = self.difference_hash(frame)
+            changed = changed or self.hash_distance(frame_hash, before_hash) > 0
+            if previous_hash is not None and self.hash_distance(frame_hash, previous_hash) == 0:
+                stable += 1
+            else:
+                stable = 1
+            previous_hash = frame_hash
+
+            now = time.perf_counter()
+            if stable >= self.settle_stable_frames and (changed or now - start >= self.settle_min_delay):
+                break
+            if now >= deadline:
+                logger.info("Screen did not settle within %ss", self.settle_timeout)
+                break
+            time.sleep(self.settle_interval)
+
+        self.settled_frame = frame
+        self.settled_frame_time = self.capture_backend.last_captured_at
+        self.last_settle_time = time.perf_counter() - start
+        get_metrics().record('settle', self.last_settle_time)
+        logger.info("Screen settled in %.0f ms (changed: %s)", self.last_settle_time * 1000, changed)
+        return changed
+
+    def produces_observation(self, action_type):
+        """Whether perform_action returns a fresh screenshot for this action, so no extra capture is needed"""
+        return action_type in OBSERVATION_ACTIONS
+        
+    def take_screenshot(self, dedup=False):
+        """Take screenshot of the selected screen and return it as an encoded Frame
+
+        With dedup=True, returns None instead of an image when the screen looks the same as
+        the last screenshot taken with dedup=True (i.e. the last one sent to the model).
+        """
+        self.refresh_config()
+        # Nothing has happened since the last settle sample, so it is still current
+        screenshot, captured_at = self.settled_frame, self.settled_frame_time
+        if screenshot is None:
+            screenshot = self.capture_backend.capture()
+            captured_at = self.capture_backend.last_captured_at
+        self.settled_frame = None
+
+        dedup_enabled = self.dedup_threshold is not None and self.dedup_threshold >= 0
+        if dedup:
+            # What the model is looking at, also used as the response cache key
+            frame_hash = self.last_observation_hash = self.difference_hash(screenshot)
+            if dedup_enabled:
+                if self.last_sent_hash is not None and \
+                        self.hash_distance(frame_hash, self.last_sent_hash) <= self.dedup_threshold:
+                    return None
+                self.last_sent_hash = frame_hash
 
         ai_screenshot = self.resize_for_ai(screenshot)
-        buffered = io.BytesIO()
-        ai_screenshot.save(buffered, format="PNG")
-        return base64.b64encode(buffered.getvalue()).decode('utf-8')
+        crop_box = None
+        if dedup and self.crop_changes:
+            crop_box = self.changed_region(ai_screenshot)
+            if crop_box == ():
+                if dedup_enabled:
+                    return None
+                # Dedup is off, so every observation still gets a frame: resend the full one
+                crop_box = None
+                self.crops_since_full_frame = 0
+            if crop_box is not None:
+                self.crops_since_full_frame += 1
+                ai_screenshot = ai_screenshot.crop(crop_box)
+        return Frame(self.encoder.encode(ai_screenshot), ai_screenshot.width, ai_screenshot.height,
+                     self.encoder.media_type, captured_at=captured_at, crop_box=crop_box)
+
+    def changed_region(self, ai_screenshot):
+        """Bounding box (left, top, right, bottom) of what changed since the last full frame sent
+
+        Returns None when a full frame should be sent instead (first frame, large change, or
+        too many crops in a row) and an empty tuple when nothing changed at all.
+        """
+        pixels = np.asarray(ai_screenshot.convert('RGB'))
+        # The model must still have the full frame the crop is relative to, so send a new one
+        # before it drops out of the screenshots kept in the history
+        max_crops = min(self.crop_full_frame_every, self.max_screenshots - 1) \
+            if self.max_screenshots is not None and self.max_screenshots >= 0 else self.crop_full_frame_every
+        if self.last_full_frame is None or self.last_full_frame.shape != pixels.shape or \
+                self.crops_since_full_frame >= max_crops:
+            self.last_full_frame = pixels
+            self.crops_since_full_frame = 0
+            return None
+
+        changed = np.any(np.abs(pixels.astype(np.int16) - self.last_full_frame) > CROP_PIXEL_TOLERANCE, axis=2)
+        rows = np.flatnonzero(changed.any(axis=1))
+        if rows.size == 0:
+            return ()
+        cols = np.flatnonzero(changed.any(axis=0))
+        height, width = changed.shape
+        left = max(int(cols[0]) - CROP_MARGIN, 0)
+        top = max(int(rows[0]) - CROP_MARGIN, 0)
+        right = min(int(cols[-1]) + 1 + CROP_MARGIN, width)
+        bottom = min(int(rows[-1]) + 1 + CROP_MARGIN, height)
+
+        if (right - left) * (bottom - top) > self.crop_max_area * width * height:
+            self.last_full_frame = pixels
+            self.crops_since_full_frame = 0
+            return None
+        return (left, top, right, bottom)
+
+    def reset_observations(self):
+        """Forget what was sent to the model, so the next screenshot is sent in full"""
+        self.last_sent_hash = None
+        self.last_observation_hash = None
+        self.last_full_frame = None
+        self.crops_since_full_frame = 0
         
     def map_from_ai_space(self, x, y):
         """Map coordinates from AI space (1280x800) to screen space"""
@@ -135,5 +441,38 @@ class ComputerControl:
         return (ai_x, ai_y)
         
     def resize_for_ai(self, screenshot):
-        """Resize screenshot to AI space dimensions"""
-        return screenshot.resize((1280, 800), Image.Resampling.LANCZOS)
+        """Resize screenshot to AI space dimensions
+
+        Large captures are first shrunk by an integer factor with Image.reduce (a cheap box
+        average), so the final filter only has to cover the remaining < 2x step.
+        """
+        target = (1280, 800)
+        if screenshot.size == target:
+            return screenshot
+        with get_metrics().span('resize'):
+            return self._resize(screenshot, target)
+
+    def _resize(self, screenshot, target):
+        factor = min(screenshot.width // target[0], screenshot.height // target[1])
+        if factor >= 2:
+            screenshot = screenshot.reduce(factor)
+        return screenshot.resize(target, self.resize_filter)
+
+    def screen_hash(self):
+        """Difference hash of the screen as it is right now, for change detection"""
+        return self.difference_hash(self.capture_backend.capture('settle_capture'))
+
+    def difference_hash(self, screenshot):
+        """Compute a difference hash (sign of horizontal gradients on a small grayscale copy)
+
+        Rising and falling edges are stored as separate bit planes, so a change that only adds
+        a falling edge (e.g. a dark region appearing on a flat background) still counts.
+        """
+        small = screenshot.convert('L').resize((HASH_WIDTH + 1, HASH_HEIGHT), Image.Resampling.BOX)
+        pixels = np.asarray(small, dtype=np.int16)
+        gradient = pixels[:, 1:] - pixels[:, :-1]
+        return np.stack([gradient > 0, gradient < 0])
+
+    def hash_distance(self, a, b):
+        """Number of differing bits between two difference hashes"""
+        return int(np.count_nonzero(a != b))
@@ -0,0 +1,101 @@
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+CONFIG_FILE = 'config.json'
+
+
+class ConfigService:
+    """Parsed contents of config.json, shared by the client, ComputerControl and the UI.
+
+    The file is parsed once and re-read only when its mtime changes (checked by `check`) or
+    when a Qt file-watcher event fires (see `watch`). Subscribers are called with the new
+    config dict after every reload.
+    """
+
+    def __init__(self, path=CONFIG_FILE):
+        self.path = path
+        self.config = {}
+        self.mtime = None
+        self.subscribers = []
+        self.watcher = None
+        self.lock = threading.Lock()
+        self.reload()
+
+    def get(self, key, default=None):
+        self.check()
+        return self.config.get(key, default)
+
+    def check(self):
+        """Reload if the file changed on disk since it was last read"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self.mtime:
+            self.reload()
+
+    def reload(self):
+        with self.lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                with open(self.path, 'r') as f:
+                    config = json.load(f)
+            except FileNotFoundError:
+                self.mtime = None
+                self.config = {}
+            except Exception as e:
+                # Keep the last good config, e.g. while an editor is halfway through saving.
+                # The mtime isn't updated, so the next check reads the file again.
+                logger.error("Error loading config from %s: %s", self.path, e)
+                return
+            else:
+                self.mtime, self.config = mtime, config
+            config = self.config
+        logger.info("Loaded config from %s", self.path)
+        for callback in list(self.subscribers):
+            callback(config)
+
+    def save(self, config):
+        # Written to a temp file and swapped in, so a reload never sees a half-written file
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(config, f)
+        os.replace(tmp_path, self.path)
+        self.reload()
+        if self.watcher is not None and self.path not in self.watcher.files():
+            self.watcher.addPath(self.path)
+
+    def subscribe(self, callback):
+        """Call `callback(config)` now and after every reload"""
+        self.subscribers.append(callback)
+        callback(self.config)
+
+    def watch(self, parent=None):
+        """Reload on Qt file-watcher events, must be called from the GUI thread"""
+        from PyQt6.QtCore import QFileSystemWatcher
+        if self.watcher is None:
+            self.watcher = QFileSystemWatcher(parent)
+            self.watcher.fileChanged.connect(self._on_file_changed)
+        if os.path.exists(self.path):
+            self.watcher.addPath(self.path)
+
+    def _on_file_changed(self, path):
+        self.reload()
+        # Editors that save by replacing the file drop it from the watcher
+        if path not in self.watcher.files() and os.path.exists(path):
+            self.watcher.addPath(path)
+
+
+_config_service = None
+
+
+def get_config_service():
+    """The shared ConfigService for config.json, created on first use"""
+    global _config_service
+    if _config_service is None:
+        _config_service = ConfigService()
+    return _config_service
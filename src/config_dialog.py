@@ -2,9 +2,9 @@ from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel,
                            QLineEdit, QTextEdit, QComboBox, QPushButton)
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QScreen
-import json
 import os
 import qtawesome as qta
+from .config import get_config_service
 
 class ConfigDialog(QDialog):
     def __init__(self, parent=None):
@@ -165,23 +165,25 @@ class ConfigDialog(QDialog):
         current_key = os.getenv("ANTHROPIC_API_KEY", "")
         self.env_key_input.setText(current_key if current_key else "Not set")
         
-        config_file = 'config.json'
-        if os.path.exists(config_file):
-            with open(config_file, 'r') as f:
-                config = json.load(f)
-                # Don't set the API key input - leave it empty for new keys only
-                self.system_prompt.setText(config.get('additional_system_prompt', ''))
-                screen_index = config.get('screen_index', 0)
-                if screen_index < self.screen_combo.count():
-                    self.screen_combo.setCurrentIndex(screen_index)
+        config_service = get_config_service()
+        config_service.check()
+        config = config_service.config
+        # Don't set the API key input - leave it empty for new keys only
+        self.system_prompt.setText(config.get('additional_system_prompt', ''))
+        screen_index = config.get('screen_index', 0)
+        if screen_index < self.screen_combo.count():
+            self.screen_combo.setCurrentIndex(screen_index)
 
     def save_config(self):
         new_api_key = self.api_key_input.text().strip()
         
-        config = {
+        # Keep any settings that aren't exposed in the dialog
+        config_service = get_config_service()
+        config = dict(config_service.config)
+        config.update({
             'additional_system_prompt': self.system_prompt.toPlainText(),
             'screen_index': self.screen_combo.currentIndex()
-        }
+        })
         
         # Only update API key if a new one was entered
         if new_api_key:
@@ -192,8 +194,7 @@ class ConfigDialog(QDialog):
             with open('.env', 'w') as f:
                 f.write(f'ANTHROPIC_API_KEY={new_api_key}')
         
-        # Save to config file
-        with open('config.json', 'w') as f:
-            json.dump(config, f)
+        # Save to config file, running components pick the changes up from the config service
+        config_service.save(config)
         
         self.accept()
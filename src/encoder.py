@@ -0,0 +1,88 @@
+import io
+import logging
+import time
+from PIL import Image
+from .metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# Image formats accepted by the Messages API, keyed by the name used in config.json
+MEDIA_TYPES = {
+    'png': 'image/png',
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+}
+COLOR_MODES = (None, 'grayscale', 'palette')
+
+DEFAULT_FORMAT = 'png'
+DEFAULT_QUALITY = 80
+DEFAULT_PNG_COMPRESS_LEVEL = 6
+DEFAULT_PALETTE_COLORS = 256
+
+
+class ScreenshotEncoder:
+    """Encodes screenshots into the bytes uploaded to the model.
+
+    `format` is one of png/jpeg/webp. `quality` applies to jpeg and webp, `png_compress_level`
+    (0-9) to png. `color_mode` can reduce the image to grayscale or an adaptive palette first.
+    """
+
+    def __init__(self, format=DEFAULT_FORMAT, quality=DEFAULT_QUALITY,
+                 png_compress_level=DEFAULT_PNG_COMPRESS_LEVEL, color_mode=None,
+                 palette_colors=DEFAULT_PALETTE_COLORS):
+        format = (format or DEFAULT_FORMAT).lower()
+        if format == 'jpg':
+            format = 'jpeg'
+        if format not in MEDIA_TYPES:
+            raise ValueError(f"Unsupported screenshot format: {format}")
+        if color_mode not in COLOR_MODES:
+            raise ValueError(f"Unsupported screenshot color mode: {color_mode}")
+        if color_mode == 'palette' and format == 'jpeg':
+            logger.warning("JPEG can't store palette images, ignoring palette color mode")
+            color_mode = None
+
+        self.format = format
+        self.quality = quality
+        self.png_compress_level = png_compress_level
+        self.color_mode = color_mode
+        self.palette_colors = palette_colors
+        self.last_size = None  # Bytes produced by the most recent encode
+        self.last_encode_time = None  # Seconds taken by the most recent encode
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            format=config.get('screenshot_format', DEFAULT_FORMAT),
+            quality=config.get('screenshot_quality', DEFAULT_QUALITY),
+            png_compress_level=config.get('png_compress_level', DEFAULT_PNG_COMPRESS_LEVEL),
+            color_mode=config.get('screenshot_color_mode'),
+            palette_colors=config.get('screenshot_palette_colors', DEFAULT_PALETTE_COLORS),
+        )
+
+    @property
+    def media_type(self):
+        return MEDIA_TYPES[self.format]
+
+    def encode(self, image):
+        start = time.perf_counter()
+
+        if self.color_mode == 'grayscale':
+            image = image.convert('L')
+        elif self.color_mode == 'palette':
+            image = image.quantize(colors=self.palette_colors, method=Image.Quantize.FASTOCTREE)
+
+        buffered = io.BytesIO()
+        if self.format == 'png':
+            image.save(buffered, format='PNG', compress_level=self.png_compress_level)
+        elif self.format == 'jpeg':
+            image.save(buffered, format='JPEG', quality=self.quality)
+        else:
+            image.save(buffered, format='WEBP', quality=self.quality)
+        data = buffered.getvalue()
+
+        self.last_size = len(data)
+        self.last_encode_time = time.perf_counter() - start
+        get_metrics().record('encode', self.last_encode_time)
+        logger.info("Encoded screenshot as %s (%s): %s bytes in %.1f ms",
+                    self.format, self.color_mode or 'color', self.last_size, self.last_encode_time * 1000)
+        return data
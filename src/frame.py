@@ -0,0 +1,126 @@
+import base64
+import hashlib
+import time
+
+
+class Frame:
+    """An encoded screenshot as it is sent to the model.
+
+    Holds the raw encoded bytes rather than a base64 string. The base64 form is built each
+    time a request is serialized and not kept, only the last few frames are sent anyway.
+    """
+    __slots__ = ('data', 'width', 'height', 'media_type', 'captured_at', 'crop_box', '_hash')
+
+    def __init__(self, data, width, height, media_type, captured_at=None, crop_box=None):
+        self.data = data
+        self.width = width
+        self.height = height
+        self.media_type = media_type
+        self.captured_at = captured_at if captured_at is not None else time.time()
+        self.crop_box = crop_box  # (left, top, right, bottom) in AI space if this is a crop
+        self._hash = None
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    @property
+    def hash(self):
+        """SHA-256 of the encoded bytes"""
+        if self._hash is None:
+            self._hash = hashlib.sha256(self.data).hexdigest()
+        return self._hash
+
+    @property
+    def base64(self):
+        return base64.b64encode(self.data).decode('utf-8')
+
+    def __repr__(self):
+        return f"<Frame {self.width}x{self.height} {self.media_type} {self.size} bytes>"
+
+
+def image_source_size(source):
+    """Encoded size in bytes of the image behind an image block's source"""
+    if source.get("type") == "frame":
+        return source["frame"].size
+    if source.get("type") == "file_ref":
+        return source["size"]
+    return len(source.get("data", ""))
+
+
+def image_source_bytes(source):
+    """Encoded image bytes behind an image block's source, reads journal files from disk"""
+    if source.get("type") == "frame":
+        return source["frame"].data
+    if source.get("type") == "file_ref":
+        with open(source["path"], 'rb') as f:
+            return f.read()
+    return base64.b64decode(source["data"])
+
+
+def encode_image_sources(history):
+    """Base64 of every in-memory frame and journal file in the history, for resolve_image_sources"""
+    encoded = {}
+    for message in history:
+        for source in _image_sources(message.get("content")):
+            if source.get("type") in ("frame", "file_ref"):
+                encoded[id(source)] = (source, _source_base64(source))
+    return encoded
+
+
+def resolve_image_sources(history, encoded=None):
+    """Replace in-memory frames and journal file references with base64 image sources.
+
+    Called when a request is serialized. The history itself is not modified. Sources found in
+    `encoded` (from encode_image_sources, done ahead of time) aren't encoded again.
+    """
+    encoded = encoded or {}
+    resolved = []
+    for message in history:
+        content = message.get("content")
+        if not isinstance(content, list):
+            resolved.append(message)
+            continue
+        new_content = [_resolve_block(block, encoded) for block in content]
+        if any(new is not old for new, old in zip(new_content, content)):
+            message = {**message, "content": new_content}
+        resolved.append(message)
+    return resolved
+
+
+def _image_sources(content):
+    if not isinstance(content, list):
+        return
+    for block in content:
+        if not isinstance(block, dict):
+            continue
+        if block.get("type") == "image":
+            yield block.get("source", {})
+        elif block.get("type") == "tool_result":
+            yield from _image_sources(block.get("content"))
+
+
+def _source_base64(source):
+    if source["type"] == "frame":
+        return source["frame"].base64
+    return base64.b64encode(image_source_bytes(source)).decode('utf-8')
+
+
+def _resolve_block(block, encoded):
+    if not isinstance(block, dict):
+        return block
+    if block.get("type") == "image":
+        source = block.get("source", {})
+        if source.get("type") not in ("frame", "file_ref"):
+            return block
+        source_and_data = encoded.get(id(source))
+        if source_and_data is not None and source_and_data[0] is source:
+            data = source_and_data[1]
+        else:
+            data = _source_base64(source)
+        return {**block, "source": {"type": "base64", "media_type": source["media_type"], "data": data}}
+    if block.get("type") == "tool_result" and isinstance(block.get("content"), list):
+        inner = [_resolve_block(item, encoded) for item in block["content"]]
+        if any(new is not old for new, old in zip(inner, block["content"])):
+            return {**block, "content": inner}
+    return block
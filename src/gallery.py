@@ -0,0 +1,258 @@
+import logging
+from collections import OrderedDict
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QObject, QRunnable, QSize, QThreadPool, pyqtSignal
+from PyQt6.QtGui import QColor, QImage, QPixmap
+from PyQt6.QtWidgets import QDialog, QLabel, QListView, QVBoxLayout, QAbstractItemView, QSizePolicy
+from .frame import image_source_bytes
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = QSize(160, 100)
+# Full-size screenshots kept decoded, older ones are decoded again when viewed
+DEFAULT_PIXMAP_CACHE_SIZE = 8
+
+
+class ImageLoadedSignal(QObject):
+    loaded = pyqtSignal(int, int, bool, object)  # generation, frame index, is thumbnail, QImage
+
+
+class DecodeJob(QRunnable):
+    """Reads and decodes one frame on the thread pool, scaled down when `size` is given.
+
+    Only QImage is used here, QPixmap can't be created outside the GUI thread.
+    """
+
+    def __init__(self, signal, generation, index, source, size=None):
+        super().__init__()
+        self.signal = signal
+        self.generation = generation
+        self.index = index
+        self.source = source
+        self.size = size
+
+    def run(self):
+        try:
+            image = QImage.fromData(image_source_bytes(self.source))
+        except OSError as e:
+            logger.warning("Could not read screenshot %s: %s", self.index, e)
+            return
+        if self.size is not None and not image.isNull():
+            image = image.scaled(self.size, Qt.AspectRatioMode.KeepAspectRatio,
+                                 Qt.TransformationMode.SmoothTransformation)
+        self.signal.loaded.emit(self.generation, self.index, self.size is not None, image)
+
+
+class FrameLoader(QObject):
+    """Thumbnails and full-size pixmaps of the current run's frames (`Store.run_frames`).
+
+    The store starts a new list for each run, the loader's images are dropped when it does.
+
+    Both are decoded on the global thread pool the first time they are asked for, the
+    getters return None until then and `thumbnail_ready` / `image_ready` fire when done.
+    All thumbnails are kept, full-size pixmaps only in an LRU of `cache_size` entries.
+    """
+    thumbnail_ready = pyqtSignal(int)
+    image_ready = pyqtSignal(int)
+
+    def __init__(self, store, cache_size=DEFAULT_PIXMAP_CACHE_SIZE, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.cache_size = cache_size
+        self.run_frames = store.run_frames
+        self.generation = 0  # Bumped on reset, so decodes finishing for a previous run are dropped
+        self.thumbnails = {}
+        self.pixmaps = OrderedDict()
+        self.pending = set()
+        self.signal = ImageLoadedSignal(self)
+        self.signal.loaded.connect(self.on_loaded)
+
+    @property
+    def frames(self):
+        if self.store.run_frames is not self.run_frames:
+            self.reset()
+        return self.run_frames
+
+    def reset(self):
+        self.run_frames = self.store.run_frames
+        self.generation += 1
+        self.thumbnails.clear()
+        self.pixmaps.clear()
+        self.pending.clear()
+
+    def set_cache_size(self, cache_size):
+        self.cache_size = max(cache_size, 1)
+        while len(self.pixmaps) > self.cache_size:
+            self.pixmaps.popitem(last=False)
+
+    def thumbnail(self, index):
+        pixmap = self.thumbnails.get(index)
+        if pixmap is None:
+            self.request(index, THUMBNAIL_SIZE)
+        return pixmap
+
+    def pixmap(self, index):
+        pixmap = self.pixmaps.get(index)
+        if pixmap is None:
+            self.request(index)
+        else:
+            self.pixmaps.move_to_end(index)
+        return pixmap
+
+    def request(self, index, size=None):
+        key = (index, size is not None)
+        if key in self.pending or not 0 <= index < len(self.frames):
+            return
+        self.pending.add(key)
+        QThreadPool.globalInstance().start(
+            DecodeJob(self.signal, self.generation, index, self.frames[index]["source"], size))
+
+    def on_loaded(self, generation, index, is_thumbnail, image):
+        if generation != self.generation:
+            return
+        self.pending.discard((index, is_thumbnail))
+        pixmap = QPixmap.fromImage(image)
+        if is_thumbnail:
+            self.thumbnails[index] = pixmap
+            self.thumbnail_ready.emit(index)
+        else:
+            self.pixmaps[index] = pixmap
+            self.set_cache_size(self.cache_size)
+            self.image_ready.emit(index)
+
+
+class FrameListModel(QAbstractListModel):
+    """One row per frame of the run, with its thumbnail as decoration"""
+
+    def __init__(self, loader, parent=None):
+        super().__init__(parent)
+        self.loader = loader
+        self.count = 0
+        self.run_frames = None
+        self.placeholder = QPixmap(THUMBNAIL_SIZE)
+        self.placeholder.fill(QColor('#333333'))
+        loader.thumbnail_ready.connect(self.on_thumbnail_ready)
+        self.refresh()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.count
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        # A new run may have started since the last refresh
+        if not index.isValid() or index.row() >= min(self.count, len(self.loader.frames)):
+            return None
+        if role == Qt.ItemDataRole.DecorationRole:
+            return self.loader.thumbnail(index.row()) or self.placeholder
+        if role == Qt.ItemDataRole.DisplayRole:
+            return f"Step {self.loader.frames[index.row()]['step']}"
+        return None
+
+    def refresh(self):
+        """Pick up frames added (or a new run started) since the last refresh"""
+        run_frames = self.loader.frames
+        count = len(run_frames)
+        if run_frames is not self.run_frames:
+            self.run_frames = run_frames
+            self.beginResetModel()
+            self.count = count
+            self.endResetModel()
+        elif count > self.count:
+            self.beginInsertRows(QModelIndex(), self.count, count - 1)
+            self.count = count
+            self.endInsertRows()
+
+    def on_thumbnail_ready(self, row):
+        if row < self.count:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+
+class GalleryDialog(QDialog):
+    """Every screenshot of the run: the selected one full size above a strip of thumbnails"""
+
+    def __init__(self, loader, parent=None):
+        super().__init__(parent)
+        self.loader = loader
+        self.setWindowTitle("Screenshots")
+        self.resize(1000, 760)
+        self.setStyleSheet("""
+            QDialog {
+                background-color: #1a1a1a;
+            }
+            QLabel {
+                background-color: #262626;
+                color: #666666;
+            }
+            QListView {
+                background-color: #1e1e1e;
+                border: none;
+                color: #e0e0e0;
+            }
+        """)
+
+        layout = QVBoxLayout()
+        self.preview = QLabel("No screenshots yet")
+        self.preview.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.preview.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored)
+        self.preview.setMinimumSize(320, 200)
+        layout.addWidget(self.preview, stretch=1)
+
+        self.model = FrameListModel(loader, self)
+        self.timeline = QListView()
+        self.timeline.setModel(self.model)
+        self.timeline.setViewMode(QListView.ViewMode.IconMode)
+        self.timeline.setFlow(QListView.Flow.LeftToRight)
+        self.timeline.setWrapping(False)
+        self.timeline.setUniformItemSizes(True)
+        self.timeline.setIconSize(THUMBNAIL_SIZE)
+        self.timeline.setMovement(QListView.Movement.Static)
+        self.timeline.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.timeline.setFixedHeight(THUMBNAIL_SIZE.height() + 48)
+        self.timeline.selectionModel().currentChanged.connect(lambda current, previous: self.show_frame(current.row()))
+        layout.addWidget(self.timeline)
+        self.setLayout(layout)
+
+        self.current = None
+        loader.image_ready.connect(self.on_image_ready)
+        self.model.modelReset.connect(self.on_run_started)
+
+    def refresh(self):
+        self.model.refresh()
+
+    def select(self, index):
+        """Show frame `index`, the latest one if None"""
+        self.refresh()
+        if self.model.count == 0:
+            return
+        if index is None or not 0 <= index < self.model.count:
+            index = self.model.count - 1
+        model_index = self.model.index(index)
+        self.timeline.setCurrentIndex(model_index)
+        self.timeline.scrollTo(model_index)
+        self.show_frame(index)
+
+    def show_frame(self, index):
+        if index < 0:
+            return
+        self.current = index
+        # Decoded on demand, show the thumbnail until the full image is ready
+        pixmap = self.loader.pixmap(index) or self.loader.thumbnails.get(index)
+        if pixmap is not None:
+            self.set_preview(pixmap)
+
+    def on_run_started(self):
+        self.current = None
+        self.preview.clear()
+        self.preview.setText("No screenshots yet")
+
+    def on_image_ready(self, index):
+        if index == self.current:
+            self.set_preview(self.loader.pixmaps[index])
+
+    def set_preview(self, pixmap):
+        self.preview.setPixmap(pixmap.scaled(self.preview.size(), Qt.AspectRatioMode.KeepAspectRatio,
+                                             Qt.TransformationMode.SmoothTransformation))
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.current is not None:
+            self.show_frame(self.current)
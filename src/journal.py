@@ -0,0 +1,77 @@
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOURNAL_DIR = 'runs'
+# Journals of older runs are deleted when a new one starts, None keeps them all
+DEFAULT_JOURNAL_MAX_RUNS = 20
+RUN_ID_PATTERN = re.compile(r'^\d{8}-\d{6}-\d{6}$')
+EXTENSIONS = {
+    'image/png': 'png',
+    'image/jpeg': 'jpg',
+    'image/webp': 'webp',
+}
+
+
+class RunJournal:
+    """Append-only on-disk record of one agent run.
+
+    Each run gets its own directory holding `journal.jsonl` (one JSON record per message or
+    action) and an `images/` folder where screenshots are stored once under their SHA-256.
+    Image blocks in the run history only hold a reference to the file, which is read back
+    when a request is serialized (see `frame.resolve_image_sources`).
+    """
+
+    def __init__(self, root=DEFAULT_JOURNAL_DIR, max_runs=DEFAULT_JOURNAL_MAX_RUNS):
+        if max_runs is not None:
+            prune_journals(root, max_runs - 1)  # Room for this run
+        run_id = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        self.path = os.path.join(root, run_id)
+        self.images_path = os.path.join(self.path, 'images')
+        os.makedirs(self.images_path, exist_ok=True)
+        self.lock = threading.Lock()  # Written from both the agent loop and the computer thread
+        self.file = open(os.path.join(self.path, 'journal.jsonl'), 'a', encoding='utf-8')
+        logger.info("Writing run journal to %s", self.path)
+
+    def append(self, kind, payload):
+        record = {'time': time.time(), 'kind': kind, 'data': payload}
+        line = json.dumps(record, default=str)
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(line + '\n')
+            self.file.flush()
+
+    def store_frame(self, frame):
+        """Write a Frame to disk, returns an image source block that references the file"""
+        path = os.path.join(self.images_path, f"{frame.hash}.{EXTENSIONS.get(frame.media_type, 'bin')}")
+        if not os.path.exists(path):
+            # Write then rename, so a crash never leaves a truncated image under the final name
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(frame.data)
+            os.replace(tmp_path, path)
+        return {"type": "file_ref", "media_type": frame.media_type, "path": path, "sha256": frame.hash, "size": frame.size}
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def prune_journals(root, keep):
+    """Delete all but the newest `keep` run journals in `root`"""
+    try:
+        # Run ids are timestamps, so they sort oldest first
+        runs = sorted(name for name in os.listdir(root) if RUN_ID_PATTERN.match(name))
+    except FileNotFoundError:
+        return
+    for name in runs[:max(len(runs) - max(keep, 0), 0)]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        logger.info("Deleted old run journal %s", name)
@@ -0,0 +1,89 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import re
+from .config import get_config_service
+
+DEFAULT_LOG_FILE = 'agent.log'
+DEFAULT_LOG_LEVEL = 'INFO'
+DEFAULT_CONSOLE_LOG_LEVEL = 'WARNING'
+DEFAULT_LOG_MAX_BYTES = 10 * 2 ** 20
+DEFAULT_LOG_BACKUP_COUNT = 5
+# The SDK and HTTP client log whole request bodies (screenshots included) at DEBUG
+DEFAULT_LOG_LEVELS = {
+    'anthropic': 'WARNING',
+    'httpx': 'WARNING',
+    'httpcore': 'WARNING',
+    'PIL': 'WARNING',
+}
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Long runs of base64 characters, i.e. encoded screenshots
+BASE64_PATTERN = re.compile(r'[A-Za-z0-9+/]{256,}={0,2}')
+
+_listener = None
+_configured_loggers = set()
+
+
+class RedactImagesFilter(logging.Filter):
+    """Replaces base64 payloads in log messages with their length"""
+
+    def filter(self, record):
+        message = record.getMessage()
+        if len(message) >= 256:
+            redacted = BASE64_PATTERN.sub(lambda match: f"<{len(match.group())} base64 chars elided>", message)
+            if len(redacted) != len(message):
+                record.msg, record.args = redacted, None
+        return True
+
+
+def setup_logging(config_service=None):
+    """Send log records through a queue to a rotating log file and the console.
+
+    Callers still format the message (QueueHandler does it before queueing, so arguments
+    can't change before they're written), but redacting image data and writing happen on the
+    listener's thread, so a slow disk never stalls the agent loop. Records below the logger's
+    level are dropped before any of that, keep large payloads at DEBUG. Levels come
+    from `log_level` and the per-logger `log_levels` mapping in config.json, and are updated
+    when it changes.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    config_service = config_service or get_config_service()
+    config = config_service.config
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        config.get('log_file', DEFAULT_LOG_FILE),
+        maxBytes=config.get('log_max_bytes', DEFAULT_LOG_MAX_BYTES),
+        backupCount=config.get('log_backup_count', DEFAULT_LOG_BACKUP_COUNT),
+        encoding='utf-8',
+    )
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(config.get('console_log_level', DEFAULT_CONSOLE_LOG_LEVEL))
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handler.addFilter(RedactImagesFilter())
+
+    log_queue = queue.SimpleQueue()
+    logging.getLogger().addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    config_service.subscribe(apply_log_levels)
+
+
+def apply_log_levels(config):
+    try:
+        logging.getLogger().setLevel(config.get('log_level', DEFAULT_LOG_LEVEL))
+        levels = {**DEFAULT_LOG_LEVELS, **config.get('log_levels', {})}
+        # Loggers that no longer have a level of their own inherit the root level again
+        for name in _configured_loggers - levels.keys():
+            logging.getLogger(name).setLevel(logging.NOTSET)
+        for name, level in levels.items():
+            logging.getLogger(name).setLevel(level)
+        _configured_loggers.clear()
+        _configured_loggers.update(levels)
+    except (ValueError, TypeError) as e:
+        logging.getLogger(__name__).error("Invalid log level in config: %s", e)
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import logging
+import os
+import time
+import numpy as np
+from .computer import HASH_WIDTH, HASH_HEIGHT
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MACRO_DIR = 'macros'
+# Max fraction of differing hash bits for the screen to still match a checkpoint
+DEFAULT_MACRO_MATCH_THRESHOLD = 0.02
+# How long to wait for the screen to reach a checkpoint before giving up (seconds)
+DEFAULT_MACRO_CHECKPOINT_TIMEOUT = 5.0
+MACRO_POLL_INTERVAL = 0.1
+# Actions that only inform the model, they are neither recorded nor replayed
+UNRECORDED_ACTIONS = {'screenshot', 'cursor_position'}
+
+
+def encode_hash(frame_hash):
+    """Hex string for a difference hash, as stored in macro files"""
+    return np.packbits(frame_hash).tobytes().hex()
+
+
+def decode_hash(value):
+    bits = np.unpackbits(np.frombuffer(bytes.fromhex(value), dtype=np.uint8))
+    return bits[:2 * HASH_HEIGHT * HASH_WIDTH].reshape(2, HASH_HEIGHT, HASH_WIDTH).astype(bool)
+
+
+class MacroLibrary:
+    """Action sequences of successful runs, saved as `macros/<key>.json` per instruction.
+
+    Every step holds the action and a checkpoint, the difference hash of the screen right
+    before the action was performed. Replaying a step first waits for the screen to match
+    its checkpoint, so a macro stops as soon as the screen diverges from the recording.
+    """
+
+    def __init__(self, root=DEFAULT_MACRO_DIR):
+        self.root = root
+
+    def path_for(self, instructions):
+        key = hashlib.sha256(instructions.strip().encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.root, f"{key}.json")
+
+    def load(self, instructions):
+        """Recorded steps for these instructions, or None if there is no macro"""
+        path = self.path_for(instructions)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                macro = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error("Error loading macro from %s: %s", path, e)
+            return None
+        if macro.get('instructions', '').strip() != instructions.strip():
+            return None
+        return macro['steps']
+
+    def save(self, instructions, steps):
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path_for(instructions)
+        macro = {'instructions': instructions, 'created_at': time.time(), 'steps': steps}
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(macro, f)
+        os.replace(tmp_path, path)
+        logger.info("Saved macro with %s steps to %s", len(steps), path)
+
+
+def macro_step(action, checkpoint):
+    """Step to record for an action performed on the screen with hash `checkpoint`"""
+    action = {key: value for key, value in action.items() if key != 'tool_use_id'}
+    return {'action': action, 'checkpoint': encode_hash(checkpoint)}
+
+
+def wait_for_checkpoint(computer_control, checkpoint, threshold=DEFAULT_MACRO_MATCH_THRESHOLD,
+                        timeout=DEFAULT_MACRO_CHECKPOINT_TIMEOUT):
+    """Wait until the screen matches a step's checkpoint, returns False if it never does"""
+    expected = decode_hash(checkpoint)
+    max_distance = threshold * expected.size
+    deadline = time.perf_counter() + timeout
+    while True:
+        distance = computer_control.hash_distance(computer_control.screen_hash(), expected)
+        if distance <= max_distance:
+            return True
+        if time.perf_counter() >= deadline:
+            logger.info("Screen diverged from macro checkpoint (%s bits differ, at most %.0f allowed)",
+                        distance, max_distance)
+            return False
+        time.sleep(MACRO_POLL_INTERVAL)
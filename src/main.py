@@ -1,23 +1,26 @@
 import sys
-import logging
 from PyQt6.QtWidgets import QApplication
 from .window import MainWindow
 from .store import Store
-from .anthropic import AnthropicClient
-
-logging.basicConfig(filename='agent.log', level=logging.DEBUG, 
-                    format='%(asctime)s - %(levelname)s - %(message)s')
+from .config import get_config_service
+from .logging_setup import setup_logging
 
 def main():
+    setup_logging()
     app = QApplication(sys.argv)
     
     app.setQuitOnLastWindowClosed(False)  # Prevent app from quitting when window is closed
     
+    # Pick up config.json edits made outside the app as soon as they're saved
+    get_config_service().watch(app)
+
+    # One client (and connection pool) shared by the store and the window
     store = Store()
-    anthropic_client = AnthropicClient()
+    anthropic_client = store.anthropic_client
     
     window = MainWindow(store, anthropic_client)
     window.show()  # Just show normally, no maximize
+    store.warm_up()
     
     sys.exit(app.exec())
 
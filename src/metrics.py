@@ -0,0 +1,176 @@
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .config import get_config_service
+
+logger = logging.getLogger(__name__)
+
+# Stages of an agent step, in the order they happen
+# 'capture' is the observation sent to the model, 'settle_capture' the grabs used to detect changes
+STAGES = ('api', 'api_ttfb', 'build_request', 'parse', 'action', 'settle', 'settle_capture', 'capture', 'resize',
+          'encode', 'prepare_images', 'history', 'step')
+METRIC_NAME = 'agent_stage_seconds'
+# Quantiles exported to Prometheus are computed over this many recent samples per stage
+WINDOW_SIZE = 1000
+SINKS = (None, 'file', 'http')
+DEFAULT_METRICS_FILE = 'metrics.prom'
+DEFAULT_METRICS_PORT = 9464
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile, 0 for no values"""
+    values = sorted(values)
+    return values[min(int(round(fraction * (len(values) - 1))), len(values) - 1)] if values else 0.0
+
+
+class Metrics:
+    """Durations of the stages of each agent step.
+
+    Spans are recorded from both the agent loop and the computer thread. Totals are kept
+    for the lifetime of the app and exported to the configured sink (`metrics_sink`: 'file'
+    writes the Prometheus text format to `metrics_file`, 'http' serves it on `metrics_port`),
+    while `run_summary` reports percentiles over the current run only.
+    """
+
+    def __init__(self, config_service=None):
+        self.lock = threading.Lock()
+        self.counts = defaultdict(int)
+        self.sums = defaultdict(float)
+        self.windows = defaultdict(lambda: deque(maxlen=WINDOW_SIZE))
+        self.run_samples = defaultdict(list)
+        self.sink = None
+        self.sink_settings = None
+        self.config_service = config_service or get_config_service()
+        self.config_service.subscribe(self.on_config_changed)
+
+    def on_config_changed(self, config):
+        settings = (config.get('metrics_sink'), config.get('metrics_file', DEFAULT_METRICS_FILE),
+                    config.get('metrics_port', DEFAULT_METRICS_PORT))
+        if settings == self.sink_settings:
+            return
+        self.sink_settings = settings
+        if self.sink is not None:
+            self.sink.close()
+            self.sink = None
+        sink, path, port = settings
+        try:
+            if sink == 'file':
+                self.sink = PrometheusFileSink(self, path)
+            elif sink == 'http':
+                self.sink = PrometheusHttpSink(self, port)
+            elif sink is not None:
+                raise ValueError(f"Unknown metrics sink: {sink}")
+        except Exception as e:
+            logger.error("Error starting metrics sink: %s", e)
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.counts[stage] += 1
+            self.sums[stage] += seconds
+            self.windows[stage].append(seconds)
+            self.run_samples[stage].append(seconds)
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def start_run(self):
+        with self.lock:
+            self.run_samples = defaultdict(list)
+
+    def flush(self):
+        """Push the current totals to the sink, called after every step"""
+        if self.sink is not None:
+            try:
+                self.sink.flush()
+            except Exception as e:
+                logger.error("Error writing metrics: %s", e)
+
+    def run_summary(self):
+        """Table of count, total, p50 and p95 per stage for the current run"""
+        with self.lock:
+            samples = {stage: list(values) for stage, values in self.run_samples.items()}
+        lines = [f"{'stage':<14} {'count':>6} {'total ms':>10} {'p50 ms':>9} {'p95 ms':>9}"]
+        for stage in sorted(samples, key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES)):
+            values = samples[stage]
+            lines.append(f"{stage:<14} {len(values):>6} {sum(values) * 1000:>10.1f} "
+                         f"{percentile(values, 0.5) * 1000:>9.1f} {percentile(values, 0.95) * 1000:>9.1f}")
+        return '\n'.join(lines)
+
+    def render_prometheus(self):
+        """Prometheus text exposition format, one summary labelled by stage"""
+        with self.lock:
+            stages = sorted(self.counts)
+            lines = [f"# HELP {METRIC_NAME} Time spent in each stage of an agent step",
+                     f"# TYPE {METRIC_NAME} summary"]
+            for stage in stages:
+                window = self.windows[stage]
+                for quantile in (0.5, 0.95):
+                    lines.append(f'{METRIC_NAME}{{stage="{stage}",quantile="{quantile}"}} {percentile(window, quantile):.6f}')
+                lines.append(f'{METRIC_NAME}_sum{{stage="{stage}"}} {self.sums[stage]:.6f}')
+                lines.append(f'{METRIC_NAME}_count{{stage="{stage}"}} {self.counts[stage]}')
+        return '\n'.join(lines) + '\n'
+
+
+class PrometheusFileSink:
+    """Rewrites a .prom file after every step, e.g. for node_exporter's textfile collector"""
+
+    def __init__(self, metrics, path=DEFAULT_METRICS_FILE):
+        self.metrics = metrics
+        self.path = path
+
+    def flush(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.metrics.render_prometheus())
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        pass
+
+
+class PrometheusHttpSink:
+    """Serves the metrics at http://127.0.0.1:<port>/metrics"""
+
+    def __init__(self, metrics, port=DEFAULT_METRICS_PORT):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                data = metrics.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True).start()
+        logger.info("Serving metrics on http://127.0.0.1:%s/metrics", port)
+
+    def flush(self):
+        pass  # Rendered on every scrape
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+_metrics = None
+
+
+def get_metrics():
+    """The shared Metrics instance, created on first use"""
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
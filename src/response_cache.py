@@ -0,0 +1,111 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import numpy as np
+from anthropic.types.beta import BetaMessage
+from .macro import encode_hash, decode_hash
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESPONSE_CACHE_PATH = 'response_cache.sqlite'
+DEFAULT_RESPONSE_CACHE_MAX_ENTRIES = 1000
+# Min fraction of matching hash bits between the current screen and a cached one for a hit
+DEFAULT_RESPONSE_CACHE_MIN_SIMILARITY = 0.98
+
+
+def prompt_key(instructions, system_prompt):
+    """Hash of everything besides the screen that determines the model's next action"""
+    return hashlib.sha256(json.dumps([instructions.strip(), system_prompt]).encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Local cache of model responses for repeated, deterministic workflows.
+
+    Entries are keyed on the instructions and system prompt (`prompt_key`), the step number
+    within the run, and the difference hash of the last screen the model saw. A lookup is a
+    hit when a cached screen hash is at least `min_similarity` similar to the current one.
+    The least recently used entries are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, path=DEFAULT_RESPONSE_CACHE_PATH, max_entries=DEFAULT_RESPONSE_CACHE_MAX_ENTRIES,
+                 min_similarity=DEFAULT_RESPONSE_CACHE_MIN_SIMILARITY):
+        self.path = path
+        self.max_entries = max_entries
+        self.min_similarity = min_similarity
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # Runs happen on a new AgentThread each time, access is serialized by the lock
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                id INTEGER PRIMARY KEY,
+                prompt_key TEXT NOT NULL,
+                step INTEGER NOT NULL,
+                frame_hash TEXT,
+                message TEXT NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                last_used REAL NOT NULL
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_key ON responses (prompt_key, step)")
+        self.db.commit()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            path=config.get('response_cache_path', DEFAULT_RESPONSE_CACHE_PATH),
+            max_entries=config.get('response_cache_max_entries', DEFAULT_RESPONSE_CACHE_MAX_ENTRIES),
+            min_similarity=config.get('response_cache_min_similarity', DEFAULT_RESPONSE_CACHE_MIN_SIMILARITY),
+        )
+
+    def get(self, key, step, frame_hash):
+        """Cached BetaMessage for this prompt, step and screen, or None"""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, frame_hash, message FROM responses WHERE prompt_key = ? AND step = ?",
+                (key, step)).fetchall()
+            best, best_similarity = None, None
+            for row_id, cached_hash, message in rows:
+                similarity = self.similarity(frame_hash, cached_hash)
+                if similarity is not None and (best_similarity is None or similarity > best_similarity):
+                    best, best_similarity = (row_id, message), similarity
+
+            if best is None or best_similarity < self.min_similarity:
+                self.misses += 1
+                logger.info("Response cache miss at step %s (best similarity: %s, %s hits, %s misses)",
+                            step, best_similarity, self.hits, self.misses)
+                return None
+            self.hits += 1
+            self.db.execute("UPDATE responses SET hits = hits + 1, last_used = ? WHERE id = ?", (time.time(), best[0]))
+            self.db.commit()
+        logger.info("Response cache hit at step %s (similarity: %.3f, %s hits, %s misses)",
+                    step, best_similarity, self.hits, self.misses)
+        return BetaMessage.model_validate_json(best[1])
+
+    def put(self, key, step, frame_hash, message):
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO responses (prompt_key, step, frame_hash, message, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, step, None if frame_hash is None else encode_hash(frame_hash), message.model_dump_json(),
+                 time.time()))
+            self.db.execute(
+                "DELETE FROM responses WHERE id NOT IN (SELECT id FROM responses ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,))
+            self.db.commit()
+
+    def similarity(self, frame_hash, cached_hash):
+        """Fraction of matching bits, None if the two can't be compared"""
+        if frame_hash is None or cached_hash is None:
+            # Nothing on screen has been seen yet, e.g. the first step of a run
+            return 1.0 if frame_hash is None and cached_hash is None else None
+        cached_hash = decode_hash(cached_hash)
+        if cached_hash.shape != frame_hash.shape:
+            return None
+        return 1 - np.count_nonzero(cached_hash != frame_hash) / frame_hash.size
+
+    def close(self):
+        with self.lock:
+            self.db.close()
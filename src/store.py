@@ -1,151 +1,465 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import logging
-from .anthropic import AnthropicClient
-from .computer import ComputerControl
+import threading
+import time
+from .anthropic import AnthropicClient, SYNTHETIC_FINISH_ID
+from .computer import ComputerControl, UNCONFIRMED_PASTE
+from .config import get_config_service
+from .journal import RunJournal, DEFAULT_JOURNAL_DIR, DEFAULT_JOURNAL_MAX_RUNS
+from .metrics import get_metrics
+from .usage import RunUsage
+from .response_cache import ResponseCache, prompt_key
+from .macro import (MacroLibrary, macro_step, wait_for_checkpoint, UNRECORDED_ACTIONS, DEFAULT_MACRO_DIR,
+                    DEFAULT_MACRO_MATCH_THRESHOLD, DEFAULT_MACRO_CHECKPOINT_TIMEOUT)
 from anthropic.types.beta import BetaMessage, BetaToolUseBlock, BetaTextBlock
 import json
 
 
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Don't warm up more often than this (seconds), pooled connections stay open for a while
+WARM_UP_INTERVAL = 60
+WARM_UP_TIMEOUT = 10
+
 class Store:
-    def __init__(self):
+    def __init__(self, anthropic_client=None, computer_control=None, config_service=None):
         self.instructions = ""
         self.fully_auto = True
         self.running = False
         self.error = None
         self.run_history = []
-        self.last_tool_use_id = None
-        self.last_screenshot = None  # Add this line
+        self.run_frames = []  # Every screenshot sent to the model this run, see record_frames
+        self.loop = None  # Event loop for the agent, created on the first run
+        self.journal = None  # On-disk record of the current run
+        self.macro_steps = None  # Steps recorded for a macro during the current run
+        # All mouse/keyboard/capture work happens on one thread, in order
+        self.computer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='computer')
+        
+        # Serializes use of self.loop between agent runs and connection warm-ups
+        self.loop_lock = threading.Lock()
+        self.last_warm_up = 0
         
+        self.config_service = config_service or get_config_service()
+        self.anthropic_client = anthropic_client
         try:
-            self.anthropic_client = AnthropicClient()
+            if self.anthropic_client is None:
+                self.anthropic_client = AnthropicClient(self.config_service)
         except ValueError as e:
             self.error = str(e)
-            logger.error(f"AnthropicClient initialization error: {self.error}")
-        self.computer_control = ComputerControl()
+            logger.error("AnthropicClient initialization error: %s", self.error)
+        self.computer_control = computer_control or ComputerControl(self.config_service)
         
     def set_instructions(self, instructions):
         self.instructions = instructions
-        logger.info(f"Instructions set: {instructions}")
+        logger.info("Instructions set: %s", instructions)
         
     def run_agent(self, update_callback):
+        """Run the agent loop to completion on this thread's event loop.
+
+        Called from AgentThread. The loop is kept on the Store and reused across runs so the
+        async client's pooled connections stay valid.
+        """
         if self.error:
             update_callback(f"Error: {self.error}")
-            logger.error(f"Agent run failed due to initialization error: {self.error}")
+            logger.error("Agent run failed due to initialization error: %s", self.error)
+            return
+
+        self.run_on_loop(self.run_agent_async(update_callback))
+
+    def run_on_loop(self, coroutine):
+        """Run a coroutine to completion on the Store's event loop from the calling thread"""
+        with self.loop_lock:
+            if self.loop is None or self.loop.is_closed():
+                self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            try:
+                return self.loop.run_until_complete(coroutine)
+            finally:
+                asyncio.set_event_loop(None)
+
+    def warm_up(self):
+        """Open an API connection in the background so the first step doesn't pay for it.
+
+        Does nothing while a run is in progress or if the pool was warmed up recently.
+        """
+        if self.error or self.running or time.monotonic() - self.last_warm_up < WARM_UP_INTERVAL:
             return
+        self.last_warm_up = time.monotonic()
 
+        def warm_up():
+            try:
+                self.run_on_loop(asyncio.wait_for(self.anthropic_client.warm_up_async(), WARM_UP_TIMEOUT))
+            except Exception as e:
+                logger.warning("Connection warm-up failed: %s", e)
+
+        threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
+    async def run_agent_async(self, update_callback):
+        loop = asyncio.get_running_loop()
         self.running = True
         self.error = None
         self.run_history = [{"role": "user", "content": self.instructions}]
+        self.run_frames = []  # A new list, the UI may still be reading the previous run's
+        self.computer_control.reset_observations()  # Always send the first screenshot of a run in full
+        request_config = self.anthropic_client.load_request_config()
+        config_service = self.config_service
+        self.journal = None
+        if config_service.get('journal_enabled', False):
+            self.journal = RunJournal(config_service.get('journal_dir', DEFAULT_JOURNAL_DIR),
+                                      config_service.get('journal_max_runs', DEFAULT_JOURNAL_MAX_RUNS))
+            self.journal.append('user', self.run_history[0])
         logger.info("Starting agent run")
-        
+
+        macro_library = MacroLibrary(config_service.get('macro_dir', DEFAULT_MACRO_DIR))
+        self.macro_steps = [] if config_service.get('record_macros', False) else None
+        self.computer_control.record_checkpoints = self.macro_steps is not None
+        steps = macro_library.load(self.instructions) if config_service.get('replay_macros', False) else None
+        if steps:
+            replayed = await self.replay_macro(steps, update_callback)
+            if replayed == len(steps) and self.running:
+                update_callback("Task completed from recorded macro.")
+                logger.info("Task completed from recorded macro")
+                self.running = False
+            elif replayed:
+                # Hand the rest of the task to the model from where the replay stopped
+                self.run_history[0] = {"role": "user", "content": (
+                    f"{self.instructions}\n\nThe first {replayed} steps of this task were already performed "
+                    f"by replaying a recording of an earlier run, then the screen no longer matched the "
+                    f"recording. Take a screenshot to see the current state and continue from there.")}
+            self.computer_control.reset_observations()
+
+        response_cache = ResponseCache.from_config(config_service) if config_service.get('response_cache_enabled', False) else None
+        metrics = get_metrics()
+        metrics.start_run()
+        run_usage = RunUsage.from_config(config_service)
+        stopped = None
+        encoded_images = None  # Screenshots for the next request, encoded while the last observation was
+
         while self.running:
             try:
-                message = self.anthropic_client.get_next_action(self.run_history)
-                self.run_history.append(message)
-                logger.debug(f"Received message from Anthropic: {message}")
-                
-                # Display assistant's message in the chat
-                self.display_assistant_message(message, update_callback)
-                
-                action = self.extract_action(message)
-                logger.info(f"Extracted action: {action}")
-                
-                if action['type'] == 'error':
-                    self.error = action['message']
-                    update_callback(f"Error: {self.error}")
-                    logger.error(f"Action extraction error: {self.error}")
-                    self.running = False
-                    break
-                elif action['type'] == 'finish':
-                    update_callback("Task completed successfully.")
-                    logger.info("Task completed successfully")
+                stopped = run_usage.budget_exceeded()
+                if stopped:
+                    # Checked before each request, so the last turn's actions have all been performed
+                    update_callback(f"Run stopped: {stopped}")
+                    logger.warning("Run stopped: %s", stopped)
                     self.running = False
                     break
+
+                step_start = time.perf_counter()
+                early_actions = {}  # tool_use_id -> future of an action started while streaming
+                message = None
+                if response_cache:
+                    step = len(self.run_history) // 2
+                    cache_key = prompt_key(self.run_history[0]['content'], request_config['system_prompt'])
+                    frame_hash = self.computer_control.last_observation_hash
+                    message = response_cache.get(cache_key, step, frame_hash)
+                cached = message is not None
+                if not cached and request_config['stream_responses']:
+                    queue_open = True
+
+                    def on_tool_use(tool_use):
+                        # Start computer actions while the rest of the response streams in, the
+                        # single-thread executor runs them in the order they were queued
+                        nonlocal queue_open
+                        action = self.parse_tool_use(tool_use) if tool_use.name == 'computer' else None
+                        if not self.running or not queue_open or action is None or action['type'] == 'error':
+                            queue_open = False
+                            return
+                        early_actions[tool_use.id] = loop.run_in_executor(
+                            self.computer_executor, self.execute_action, action)
+
+                    message = await self.anthropic_client.stream_next_action(
+                        self.run_history, request_config,
+                        on_text=lambda text: update_callback(f"Assistant delta:{text}"),
+                        on_tool_use=on_tool_use,
+                        encoded_images=encoded_images,
+                    )
+                elif not cached:
+                    message = await self.anthropic_client.get_next_action_async(
+                        self.run_history, request_config, encoded_images)
+                encoded_images = None
+                with metrics.span('history'):
+                    self.run_history.append(message)
+                    if self.journal:
+                        self.journal.append('assistant', message.model_dump(mode='json'))
+                logger.debug("Received message from Anthropic: %s", message)
+                # Cached responses cost nothing but still count as a step
+                step_usage = run_usage.add_step(None if cached else message.usage, message.model)
+                update_callback(f"Usage: {json.dumps(step_usage)}")
+                if self.journal:
+                    self.journal.append('usage', step_usage)
+                
+                with metrics.span('parse'):
+                    # Display assistant's message in the chat, text was already shown live when streaming
+                    self.display_assistant_message(message, update_callback, show_text=cached or not request_config['stream_responses'])
+                    actions = self.extract_actions(message)
+                logger.info("Extracted actions: %s", actions)
+                if response_cache and not cached and all(action['type'] != 'error' for action in actions):
+                    response_cache.put(cache_key, step, frame_hash, message)
                 
-                result = self.computer_control.perform_action(action)
-                if action['type'] == 'screenshot':
-                    self.last_screenshot = result  # Store the screenshot
+                # Execute every tool call in order, each one gets its own tool_result
+                tool_results = []
+                for action in actions:
+                    if not self.running:
+                        break  # Stopped by the user, leave the remaining actions undone
+                    if action['type'] == 'error':
+                        self.error = action['message']
+                        update_callback(f"Error: {self.error}")
+                        logger.error("Action extraction error: %s", self.error)
+                        self.running = False
+                        break
+                    elif action['type'] == 'finish':
+                        update_callback("Task completed successfully.")
+                        logger.info("Task completed successfully")
+                        # Only successful runs are worth replaying, not ones where the model gave up
+                        if self.macro_steps and action['success'] and action['tool_use_id'] != SYNTHETIC_FINISH_ID:
+                            macro_library.save(self.instructions, self.macro_steps)
+                        self.running = False
+                        break
+                    
+                    future = early_actions.pop(action['tool_use_id'], None)
+                    if future is None:
+                        # Blocking pyautogui/capture work runs off the event loop
+                        future = loop.run_in_executor(self.computer_executor, self.execute_action, action)
+                    _, tool_result = await future
+                    if action['type'] == 'screenshot':
+                        # The pill is shown once the screenshot exists, so it can open that frame
+                        frame_index = self.record_frames(tool_result["content"], update_callback)
+                        if frame_index is None and self.run_frames:
+                            frame_index = len(self.run_frames) - 1  # Screen unchanged since the last frame
+                        update_callback(f"Performed action: {json.dumps({'type': 'screenshot', 'frame': frame_index})}")
 
-                logger.info(f"Performed action: {action['type']}")
+                    logger.info("Performed action: %s", action['type'])
+                    tool_results.append(tool_result)
+
+                if not self.running:
+                    break
                 
-                screenshot = self.computer_control.take_screenshot()
-                self.last_screenshot = screenshot  # Store every screenshot
-                self.run_history.append({
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "tool_result",
-                            "tool_use_id": self.last_tool_use_id,
-                            "content": [
-                                {"type": "text", "text": "Here is a screenshot after the action was executed"},
-                                {"type": "image", "source": {"type": "base64", "media_type": "image/png", "data": screenshot}}
-                            ]
-                        }
-                    ]
-                })
-                logger.debug("Screenshot added to run history")
+                request_config = self.anthropic_client.load_request_config()
+                if self.computer_control.produces_observation(actions[-1]['type']):
+                    # The last action already returned a fresh screenshot, no need to capture another
+                    logger.debug("Reusing screenshot from the last action")
+                else:
+                    observation = loop.run_in_executor(self.computer_executor, self.capture_observation)
+                    # Overlaps with the capture and encode, which release the GIL
+                    encoded_images = self.anthropic_client.prepare_images(
+                        self.run_history + [{"role": "user", "content": tool_results}], request_config)
+                    content = await observation
+                    # A single screenshot is attached to the last tool result
+                    tool_results[-1]["content"].extend(content)
+                    self.record_frames(content, update_callback)
+                with metrics.span('history'):
+                    self.run_history.append({
+                        "role": "user",
+                        "content": tool_results
+                    })
+                    if self.journal:
+                        self.journal.append('user', self.run_history[-1])
+                metrics.record('step', time.perf_counter() - step_start)
+                metrics.flush()
                 
             except Exception as e:
                 self.error = str(e)
                 update_callback(f"Error: {self.error}")
-                logger.exception(f"Unexpected error during agent run: {self.error}")
+                logger.exception("Unexpected error during agent run: %s", self.error)
                 self.running = False
                 break
+
+        metrics.flush()
+        logger.info("Step timings for this run:\n%s", metrics.run_summary())
+        if response_cache:
+            logger.info("Response cache: %s hits, %s misses", response_cache.hits, response_cache.misses)
+            response_cache.close()
+        if self.journal:
+            self.journal.append('end', {'error': self.error, 'stopped': stopped, 'steps': run_usage.steps,
+                                        'tokens': run_usage.totals, 'cost': run_usage.cost})
+            self.journal.close()
+        self.computer_control.record_checkpoints = False
         
     def stop_run(self):
         self.running = False
         logger.info("Agent run stopped")
         
-    def extract_action(self, message):
-        logger.debug(f"Extracting action from message: {message}")
+    def extract_actions(self, message):
+        """Return the parsed action for every tool_use block in the message, in order"""
+        logger.debug("Extracting actions from message: %s", message)
         if not isinstance(message, BetaMessage):
-            logger.error(f"Unexpected message type: {type(message)}")
-            return {'type': 'error', 'message': 'Unexpected message type'}
+            logger.error("Unexpected message type: %s", type(message))
+            return [{'type': 'error', 'message': 'Unexpected message type'}]
         
+        actions = []
         for item in message.content:
             if isinstance(item, BetaToolUseBlock):
-                tool_use = item
-                logger.debug(f"Found tool use: {tool_use}")
-                self.last_tool_use_id = tool_use.id
-                if tool_use.name == 'finish_run':
-                    return {'type': 'finish'}
-                
-                if tool_use.name != 'computer':
-                    logger.error(f"Unexpected tool: {tool_use.name}")
-                    return {'type': 'error', 'message': f"Unexpected tool: {tool_use.name}"}
-                
-                input_data = tool_use.input
-                action_type = input_data.get('action')
-                
-                if action_type in ['mouse_move', 'left_click_drag']:
-                    if 'coordinate' not in input_data or len(input_data['coordinate']) != 2:
-                        logger.error(f"Invalid coordinate for mouse action: {input_data}")
-                        return {'type': 'error', 'message': 'Invalid coordinate for mouse action'}
-                    return {
-                        'type': action_type,
-                        'x': input_data['coordinate'][0],
-                        'y': input_data['coordinate'][1]
-                    }
-                elif action_type in ['left_click', 'right_click', 'middle_click', 'double_click', 'screenshot', 'cursor_position']:
-                    return {'type': action_type}
-                elif action_type in ['type', 'key']:
-                    if 'text' not in input_data:
-                        logger.error(f"Missing text for keyboard action: {input_data}")
-                        return {'type': 'error', 'message': 'Missing text for keyboard action'}
-                    return {'type': action_type, 'text': input_data['text']}
-                else:
-                    logger.error(f"Unsupported action: {action_type}")
-                    return {'type': 'error', 'message': f"Unsupported action: {action_type}"}
+                actions.append(self.parse_tool_use(item))
+        
+        if not actions:
+            logger.error("No tool use found in message")
+            return [{'type': 'error', 'message': 'No tool use found in message'}]
+        return actions
+
+    def execute_action(self, action):
+        """Perform an action and build its tool_result, on the computer executor thread
+
+        The result is built right away so screenshot details (media type, crop region) can't be
+        overwritten by an action queued after this one. Actions still queued when the run is
+        stopped are skipped.
+        """
+        if not self.running:
+            return None, None
+        result = self.computer_control.perform_action(action)
+        if self.journal:
+            self.journal.append('action', {'action': action, 'result': result if action['type'] != 'screenshot' else None})
+        self.record_macro_step(action)
+        return result, self.make_tool_result(action, result)
+
+    def record_macro_step(self, action):
+        checkpoint = self.computer_control.last_checkpoint
+        if self.macro_steps is not None and action['type'] not in UNRECORDED_ACTIONS and checkpoint is not None:
+            self.macro_steps.append(macro_step(action, checkpoint))
+
+    async def replay_macro(self, steps, update_callback):
+        """Re-execute recorded steps locally without calling the API
+
+        Stops at the first step whose checkpoint doesn't match the screen, returns the number
+        of steps performed.
+        """
+        loop = asyncio.get_running_loop()
+        config_service = self.config_service
+        threshold = config_service.get('macro_match_threshold', DEFAULT_MACRO_MATCH_THRESHOLD)
+        timeout = config_service.get('macro_checkpoint_timeout', DEFAULT_MACRO_CHECKPOINT_TIMEOUT)
+        update_callback(f"Assistant: Replaying a recorded macro of {len(steps)} steps")
+        logger.info("Replaying macro with %s steps", len(steps))
+
+        def replay_step(step):
+            if not wait_for_checkpoint(self.computer_control, step['checkpoint'], threshold, timeout):
+                return False
+            self.execute_replayed_action(step['action'])
+            return True
+
+        for index, step in enumerate(steps):
+            if not self.running:
+                return index
+            if not await loop.run_in_executor(self.computer_executor, replay_step, step):
+                update_callback(f"Assistant: The screen differs from the recording at step {index + 1}, "
+                                f"continuing with the model")
+                return index
+            action = step['action']
+            update_callback(f"Performed action: {json.dumps({'type': action['type'], 'x': action.get('x'), 'y': action.get('y'), 'text': action.get('text')})}")
+        return len(steps)
+
+    def execute_replayed_action(self, action):
+        """Perform a macro step, on the computer executor thread"""
+        result = self.computer_control.perform_action(action)
+        if self.journal:
+            self.journal.append('replay', {'action': action, 'result': result})
+        self.record_macro_step(action)
+
+    def capture_observation(self):
+        """Take the post-action screenshot and build its tool_result content, on the computer executor thread"""
+        return self.screenshot_content(self.computer_control.take_screenshot(dedup=True))
+
+    def record_frames(self, content, update_callback):
+        """Add the images in tool result content to run_frames for the gallery
+
+        Only the image source is kept, so frames stored in the run journal stay on disk.
+        Returns the index of the last frame added, or None.
+        """
+        index = None
+        for block in content:
+            if block.get("type") == "image":
+                self.run_frames.append({"source": block["source"], "step": len(self.run_history) // 2})
+                index = len(self.run_frames) - 1
+                update_callback(f"Frame: {index}")
+        return index
+
+    def make_tool_result(self, action, result):
+        if action['type'] == 'cursor_position':
+            content = [{"type": "text", "text": f"The cursor is at ({result[0]:.0f}, {result[1]:.0f})"}]
+        elif action['type'] == 'type':
+            text = f"Typed {len(action['text'])} characters (method: {result})"
+            if result == UNCONFIRMED_PASTE:
+                text += ". The paste could not be confirmed, check the screen before typing the text again"
+            content = [{"type": "text", "text": text}]
+        elif self.computer_control.produces_observation(action['type']):
+            content = self.screenshot_content(result)
+        else:
+            content = [{"type": "text", "text": f"Executed {action['type']}"}]
+        return {
+            "type": "tool_result",
+            "tool_use_id": action['tool_use_id'],
+            "content": content
+        }
+
+    def screenshot_content(self, frame):
+        """Tool result content for a Frame from take_screenshot(dedup=True)"""
+        if frame is None:
+            # Screen looks the same as the last screenshot sent, don't upload it again
+            logger.debug("Screen unchanged, no screenshot added to run history")
+            return [{"type": "text", "text": "The screen is unchanged since the last screenshot"}]
+        logger.debug("Screenshot added to run history")
+        crop_box = frame.crop_box
+        if crop_box is not None:
+            text = (f"Only part of the screen changed since the last full screenshot. This image is the region "
+                    f"from ({crop_box[0]}, {crop_box[1]}) to ({crop_box[2]}, {crop_box[3]}) in screen coordinates, "
+                    f"the rest of the screen is unchanged")
+        else:
+            text = "Here is a screenshot after the action was executed"
+        if self.journal:
+            # Keep only a reference to the file in memory, it's read back when the request is sent
+            source = self.journal.store_frame(frame)
+        else:
+            # Base64 is only produced when the request is serialized
+            source = {"type": "frame", "media_type": frame.media_type, "frame": frame}
+        return [
+            {"type": "text", "text": text},
+            {"type": "image", "source": source}
+        ]
+
+    def parse_tool_use(self, tool_use):
+        """Action dict for a tool_use block, tagged with its id for the tool_result"""
+        action = self._parse_tool_use(tool_use)
+        action['tool_use_id'] = tool_use.id
+        return action
+
+    def _parse_tool_use(self, tool_use):
+        logger.debug("Found tool use: %s", tool_use)
+        if tool_use.name == 'finish_run':
+            return {'type': 'finish', 'success': bool(tool_use.input.get('success', False))}
+        
+        if tool_use.name != 'computer':
+            logger.error("Unexpected tool: %s", tool_use.name)
+            return {'type': 'error', 'message': f"Unexpected tool: {tool_use.name}"}
+        
+        input_data = tool_use.input
+        action_type = input_data.get('action')
         
-        logger.error("No tool use found in message")
-        return {'type': 'error', 'message': 'No tool use found in message'}
+        if action_type in ['mouse_move', 'left_click_drag']:
+            if 'coordinate' not in input_data or len(input_data['coordinate']) != 2:
+                logger.error("Invalid coordinate for mouse action: %s", input_data)
+                return {'type': 'error', 'message': 'Invalid coordinate for mouse action'}
+            return {
+                'type': action_type,
+                'x': input_data['coordinate'][0],
+                'y': input_data['coordinate'][1]
+            }
+        elif action_type in ['left_click', 'right_click', 'middle_click', 'double_click', 'screenshot', 'cursor_position']:
+            return {'type': action_type}
+        elif action_type in ['type', 'key']:
+            if 'text' not in input_data:
+                logger.error("Missing text for keyboard action: %s", input_data)
+                return {'type': 'error', 'message': 'Missing text for keyboard action'}
+            return {'type': action_type, 'text': input_data['text']}
+        else:
+            logger.error("Unsupported action: %s", action_type)
+            return {'type': 'error', 'message': f"Unsupported action: {action_type}"}
 
-    def display_assistant_message(self, message, update_callback):
+    def display_assistant_message(self, message, update_callback, show_text=True):
         if isinstance(message, BetaMessage):
             for item in message.content:
                 if isinstance(item, BetaTextBlock):
+                    if not show_text:
+                        continue
                     # Clean and format the text
                     text = item.text.strip()
                     if text:  # Only send non-empty messages
@@ -157,6 +471,8 @@ class Store:
                     
                     # Convert tool use to a more readable format
                     if tool_name == 'computer':
+                        if tool_input.get('action') == 'screenshot':
+                            continue  # Shown after it's taken, with its frame
                         action = {
                             'type': tool_input.get('action'),
                             'x': tool_input.get('coordinate', [0, 0])[0] if 'coordinate' in tool_input else None,
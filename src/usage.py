@@ -0,0 +1,73 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# US dollars per million tokens: (input, output, cache write, cache read)
+PRICES = {
+    'claude-3-5-sonnet-20241022': (3.00, 15.00, 3.75, 0.30),
+}
+DEFAULT_PRICES = PRICES['claude-3-5-sonnet-20241022']
+TOKEN_FIELDS = ('input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens')
+
+
+class RunUsage:
+    """Token and cost totals of one agent run, and the budget it must stay within.
+
+    `max_tokens` counts every token billed (input, output and cache), `max_cost` is in US
+    dollars and `max_steps` counts model turns. None means no limit.
+    """
+
+    def __init__(self, max_tokens=None, max_cost=None, max_steps=None):
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.max_steps = max_steps
+        self.steps = 0
+        self.totals = dict.fromkeys(TOKEN_FIELDS, 0)
+        self.cost = 0.0
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            max_tokens=config.get('budget_max_tokens'),
+            max_cost=config.get('budget_max_cost'),
+            max_steps=config.get('budget_max_steps'),
+        )
+
+    @property
+    def total_tokens(self):
+        return sum(self.totals.values())
+
+    def add_step(self, usage=None, model=None):
+        """Count a model turn and its usage (None for a response served from the cache).
+
+        Returns the step's record, with both the step's and the run's token counts and cost.
+        """
+        self.steps += 1
+        step = {field: (getattr(usage, field, 0) or 0) if usage is not None else 0 for field in TOKEN_FIELDS}
+        prices = PRICES.get(model, DEFAULT_PRICES)
+        step_cost = sum(step[field] * price for field, price in zip(TOKEN_FIELDS, prices)) / 1_000_000
+        for field in TOKEN_FIELDS:
+            self.totals[field] += step[field]
+        self.cost += step_cost
+        record = {
+            'step': self.steps,
+            'tokens': step,
+            'cost': step_cost,
+            'total_tokens': dict(self.totals),
+            'total_cost': self.cost,
+        }
+        logger.info("Step %s usage: input=%s output=%s cache_write=%s cache_read=%s cost=$%.4f, "
+                    "run total: %s tokens, $%.4f", self.steps, step['input_tokens'], step['output_tokens'],
+                    step['cache_creation_input_tokens'], step['cache_read_input_tokens'], step_cost,
+                    self.total_tokens, self.cost)
+        return record
+
+    def budget_exceeded(self):
+        """Why the run has to stop before its next model turn, or None"""
+        if self.max_steps is not None and self.steps >= self.max_steps:
+            return f"step limit of {self.max_steps} reached"
+        if self.max_tokens is not None and self.total_tokens >= self.max_tokens:
+            return f"token budget of {self.max_tokens} reached ({self.total_tokens} tokens used)"
+        if self.max_cost is not None and self.cost >= self.max_cost:
+            return f"cost budget of ${self.max_cost:g} reached (${self.cost:.4f} spent)"
+        return None
@@ -1,9 +1,13 @@
 from PyQt6.QtWidgets import (QMainWindow, QVBoxLayout, QHBoxLayout, QWidget, QTextEdit, 
-                             QPushButton, QLabel, QProgressBar, QSystemTrayIcon, QMenu, QApplication, QDialog, QLineEdit, QMenuBar, QTextBrowser)
+                             QPushButton, QLabel, QProgressBar, QSystemTrayIcon, QMenu, QApplication, QDialog, QLineEdit, QMenuBar,
+                             QFileDialog)
 from PyQt6.QtCore import Qt, QPoint, pyqtSignal, QThread, QUrl, QSettings
 from PyQt6.QtGui import QFont, QKeySequence, QShortcut, QAction, QTextCursor, QDesktopServices
 from .store import Store
-from .anthropic import AnthropicClient  
+from .config import get_config_service
+from .action_log import ActionLogModel, ActionLogView, LogEntry, EntryRole, DEFAULT_MAX_ENTRIES
+from .gallery import FrameLoader, GalleryDialog, DEFAULT_PIXMAP_CACHE_SIZE
+import json
 import logging
 import qtawesome as qta
 
@@ -22,11 +26,16 @@ class AgentThread(QThread):
         self.finished_signal.emit()
 
 class MainWindow(QMainWindow):
+    # config.json may be reloaded on the agent or computer thread, UI settings are applied
+    # from this signal so they always change on the GUI thread
+    config_changed = pyqtSignal(object)
+
     def __init__(self, store, anthropic_client):
         super().__init__()
         self.store = store
         self.anthropic_client = anthropic_client
         self.app = QApplication.instance()  # Get the QApplication instance
+        self.streaming_text = False  # Whether streamed text is being appended to the log
         
         # Initialize theme settings
         self.settings = QSettings('Grunty', 'Preferences')
@@ -118,7 +127,7 @@ class MainWindow(QMainWindow):
             
         # Reinitialize the store and anthropic client
         self.store = Store()
-        self.anthropic_client = AnthropicClient()
+        self.anthropic_client = self.store.anthropic_client
         dialog.accept()
 
     def setup_ui(self):
@@ -214,12 +223,17 @@ class MainWindow(QMainWindow):
         container_layout.addWidget(title_bar)
         
         # Action log with modern styling - Now at the top with flexible space
-        self.action_log = QTextBrowser()
-        self.action_log.setReadOnly(True)
-        self.action_log.setOpenExternalLinks(False)  # Prevent automatic link handling
-        self.action_log.anchorClicked.connect(self.handle_link_click)  # Connect link clicks
+        # Only the most recent entries are kept in the view, the full log can be exported
+        self.log_model = ActionLogModel(parent=self)
+        self.action_log = ActionLogView(self.log_model)
+        # Screenshots of the run are decoded off the GUI thread, only when the gallery shows them
+        self.frame_loader = FrameLoader(self.store, parent=self)
+        self.gallery = None
+        self.config_changed.connect(self.apply_config)
+        get_config_service().subscribe(self.config_changed.emit)
+        self.action_log.clicked.connect(self.handle_log_click)
         self.action_log.setStyleSheet("""
-            QTextBrowser {
+            QListView {
                 background-color: #262626;
                 border: none;
                 border-radius: 0;
@@ -249,6 +263,19 @@ class MainWindow(QMainWindow):
         self.progress_bar.hide()
         container_layout.addWidget(self.progress_bar)
 
+        # Token and cost totals of the current run
+        self.usage_label = QLabel()
+        self.usage_label.setStyleSheet("""
+            QLabel {
+                color: #888888;
+                padding: 4px 16px;
+                font-family: Inter;
+                font-size: 11px;
+            }
+        """)
+        self.usage_label.hide()
+        container_layout.addWidget(self.usage_label)
+
         # Input section container - Fixed height at bottom
         input_section = QWidget()
         input_section.setObjectName("input_section")
@@ -359,12 +386,18 @@ class MainWindow(QMainWindow):
         # Connect signals
         self.run_button.clicked.connect(self.run_agent)
         self.stop_button.clicked.connect(self.stop_agent)
+        # Reopen the API connection while the user is still typing the instructions
+        self.input_area.textChanged.connect(lambda: self.store.warm_up())
         minimize_button.clicked.connect(self.showMinimized)
         close_button.clicked.connect(self.close)
         
         # Update the theme
         self.apply_theme()
         
+    def apply_config(self, config):
+        self.log_model.set_max_entries(config.get('action_log_max_entries', DEFAULT_MAX_ENTRIES))
+        self.frame_loader.set_cache_size(config.get('gallery_pixmap_cache_size', DEFAULT_PIXMAP_CACHE_SIZE))
+
     def update_theme_button(self):
         if self.dark_mode:
             self.theme_button.setIcon(qta.icon('fa5s.sun', color='white'))
@@ -428,7 +461,7 @@ class MainWindow(QMainWindow):
 
         # Update action log
         self.action_log.setStyleSheet(f"""
-            QTextEdit {{
+            QListView {{
                 background-color: {colors['secondary_bg']};
                 border: none;
                 border-radius: 0;
@@ -438,6 +471,7 @@ class MainWindow(QMainWindow):
                 font-size: 13px;
             }}
         """)
+        self.action_log.itemDelegate().set_text_color('#e0e0e0' if self.dark_mode else '#333333')
 
         # Update input area
         self.input_area.setStyleSheet(f"""
@@ -557,10 +591,33 @@ class MainWindow(QMainWindow):
         quit_action.setShortcut('Ctrl+Q')
         quit_action.triggered.connect(self.quit_application)
         
+        export_log = QAction('Export Full Log…', self)
+        export_log.triggered.connect(self.export_log)
+
+        gallery = QAction('Screenshot Gallery', self)
+        gallery.setShortcut('Ctrl+G')
+        gallery.triggered.connect(lambda: self.show_gallery())
+
         file_menu.addAction(new_task)
+        file_menu.addAction(gallery)
+        file_menu.addAction(export_log)
         file_menu.addSeparator()
         file_menu.addAction(quit_action)
 
+        # Macros menu, both options are stored in config.json
+        macros_menu = menubar.addMenu('Macros')
+        config = get_config_service().config
+        for label, key in (('Record Successful Runs', 'record_macros'), ('Replay Recorded Runs', 'replay_macros')):
+            action = QAction(label, self)
+            action.setCheckable(True)
+            action.setChecked(config.get(key, False))
+            action.toggled.connect(lambda checked, key=key: self.set_macro_option(key, checked))
+            macros_menu.addAction(action)
+
+    def set_macro_option(self, key, enabled):
+        config_service = get_config_service()
+        config_service.save({**config_service.config, key: enabled})
+
     def setup_tray(self):
         self.tray_icon = QSystemTrayIcon(self)
         # Make the icon larger and more visible
@@ -648,7 +705,8 @@ class MainWindow(QMainWindow):
         self.run_button.setEnabled(False)
         self.stop_button.setEnabled(True)
         self.progress_bar.show()
-        self.action_log.clear()
+        self.log_model.clear()
+        self.usage_label.clear()
         
         self.agent_thread = AgentThread(self.store)
         self.agent_thread.update_signal.connect(self.update_log)
@@ -665,208 +723,98 @@ class MainWindow(QMainWindow):
         self.progress_bar.hide()
         
         # Yellow completion message with sparkle emoji
-        completion_message = '''
-            <div style="margin: 6px 0;">
-                <span style="
-                    display: inline-flex;
-                    align-items: center;
-                    background-color: rgba(45, 45, 45, 0.95);
-                    border: 1px solid rgba(255, 255, 255, 0.1);
-                    border-radius: 100px;
-                    padding: 4px 12px;
-                    color: #FFD700;
-                    font-family: Inter, -apple-system, system-ui, sans-serif;
-                    font-size: 13px;
-                    line-height: 1.4;
-                    white-space: nowrap;
-                ">✨ Agent run completed</span>
-            </div>
-        '''
-        self.action_log.append(completion_message)
-        
-        
+        self.log_model.append(LogEntry('completion', icon='✨', label='Agent run completed'))
+
     def update_log(self, message):
+        # Streamed text is appended to the current assistant message as it arrives
+        if message.startswith("Assistant delta:"):
+            delta = message[len("Assistant delta:"):]
+            if self.streaming_text:
+                self.log_model.append_text(delta)
+            elif delta.strip():
+                self.log_model.append(LogEntry('assistant', text=delta.lstrip()))
+                self.streaming_text = True
+            return
+        self.streaming_text = False
+
+        if message.startswith("Usage:"):
+            self.update_usage(json.loads(message[len("Usage:"):]))
+            return
+
+        if message.startswith("Frame:"):
+            if self.gallery is not None and self.gallery.isVisible():
+                self.gallery.refresh()
+            return
+
         if message.startswith("Performed action:"):
             action_text = message.replace("Performed action:", "").strip()
-            
             try:
-                import json
-                action_data = json.loads(action_text)
-                action_type = action_data.get('type', '').lower()
-                
-                if action_type == "type":
-                    text = action_data.get('text', '')
-                    msg = f'⌨️ <span style="margin: 0 4px; color: #4CAF50;">Typed</span> <span style="color: #4CAF50">"{text}"</span>'
-                    self.action_log.append(self._format_pill(msg))
-                    
-                elif action_type == "key":
-                    key = action_data.get('text', '')
-                    msg = f'⌨️ <span style="margin: 0 4px; color: #4CAF50;">Pressed</span> <span style="color: #4CAF50">{key}</span>'
-                    self.action_log.append(self._format_pill(msg))
-                    
-                elif action_type == "mouse_move":
-                    x = action_data.get('x', 0)
-                    y = action_data.get('y', 0)
-                    msg = f'🖱️ <span style="margin: 0 4px; color: #4CAF50;">Moved to</span> <span style="color: #4CAF50">({x}, {y})</span>'
-                    self.action_log.append(self._format_pill(msg))
-                    
-                elif action_type == "screenshot":
-                    msg = '''
-                        <div style="margin: 6px 0;">
-                            <a href="screenshot://" style="
-                                display: inline-flex;
-                                align-items: center;
-                                background-color: rgba(45, 45, 45, 0.95);
-                                border: 1px solid rgba(255, 255, 255, 0.1);
-                                border-radius: 100px;
-                                padding: 4px 12px;
-                                color: #4CAF50;
-                                text-decoration: none;
-                                font-family: Inter, -apple-system, system-ui, sans-serif;
-                                font-size: 13px;
-                                line-height: 1.4;
-                                white-space: nowrap;
-                            ">📸 View Screenshot</a>
-                        </div>
-                    '''
-                    self.action_log.append(msg)
-                    
-                elif "click" in action_type:
-                    x = action_data.get('x', 0)
-                    y = action_data.get('y', 0)
-                    click_map = {
-                        "left_click": "Left Click",
-                        "right_click": "Right Click",
-                        "middle_click": "Middle Click",
-                        "double_click": "Double Click"
-                    }
-                    click_type = click_map.get(action_type, "Click")
-                    msg = f'👆 <span style="margin: 0 4px; color: #4CAF50;">{click_type}</span> <span style="color: #4CAF50">({x}, {y})</span>'
-                    self.action_log.append(self._format_pill(msg))
-                    
+                entry = self.action_entry(json.loads(action_text))
             except json.JSONDecodeError:
-                self.action_log.append(self._format_pill(action_text))
+                entry = LogEntry('action', label=action_text)
+            if entry is not None:
+                self.log_model.append(entry)
 
-        # Clean assistant message style without green background
         elif message.startswith("Assistant:"):
-            message_style = '''
-                <div style="
-                    border-left: 2px solid #666;
-                    padding: 8px 16px;
-                    margin: 8px 0;
-                    font-family: Inter, -apple-system, system-ui, sans-serif;
-                    font-size: 13px;
-                    line-height: 1.5;
-                    color: #e0e0e0;
-                ">{}</div>
-            '''
-            clean_message = message.replace("Assistant:", "").strip()
-            self.action_log.append(message_style.format(f'💬 {clean_message}'))
+            self.log_model.append(LogEntry('assistant', text=message.replace("Assistant:", "").strip()))
 
         # Subtle assistant action style
         elif message.startswith("Assistant action:"):
-            action_style = '''
-                <div style="
-                    color: #666;
-                    font-style: italic;
-                    padding: 4px 0;
-                    font-size: 12px;
-                    font-family: Inter, -apple-system, system-ui, sans-serif;
-                    line-height: 1.4;
-                ">🤖 {}</div>
-            '''
-            clean_message = message.replace("Assistant action:", "").strip()
-            self.action_log.append(action_style.format(clean_message))
-
-        # Regular message style
-        else:
-            regular_style = '''
-                <div style="
-                    padding: 4px 0;
-                    color: #e0e0e0;
-                    font-family: Inter, -apple-system, system-ui, sans-serif;
-                    font-size: 13px;
-                    line-height: 1.4;
-                ">{}</div>
-            '''
-            self.action_log.append(regular_style.format(message))
-
-        # Scroll to bottom
-        self.action_log.verticalScrollBar().setValue(
-            self.action_log.verticalScrollBar().maximum()
-        )
+            self.log_model.append(LogEntry('assistant_action', text=message.replace("Assistant action:", "").strip()))
 
-    def _format_pill(self, text):
-        return f'''
-            <div style="margin: 6px 0;">
-                <span style="
-                    display: inline-flex;
-                    align-items: center;
-                    background-color: rgba(45, 45, 45, 0.95);
-                    border: 1px solid rgba(255, 255, 255, 0.1);
-                    border-radius: 100px;
-                    padding: 4px 12px;
-                    font-family: Inter, -apple-system, system-ui, sans-serif;
-                    font-size: 13px;
-                    line-height: 1.4;
-                    white-space: nowrap;
-                ">{text}</span>
-            </div>
-        '''
-
-    def show_screenshot(self, screenshot_data):
-        if not screenshot_data:
-            return
-            
-        # Create a new dialog to show the screenshot
-        dialog = QDialog(self)
-        dialog.setWindowTitle("Screenshot")
-        dialog.setStyleSheet("""
-            QDialog {
-                background-color: #1a1a1a;
-            }
-            QPushButton {
-                background-color: #4CAF50;
-                color: white;
-                border: none;
-                padding: 8px 16px;
-                border-radius: 4px;
-                font-weight: bold;
-            }
-            QPushButton:hover {
-                background-color: #45a049;
+        else:
+            self.log_model.append(LogEntry('message', text=message))
+
+    def action_entry(self, action_data):
+        """Log entry for a performed computer action, None for actions that aren't shown"""
+        action_type = (action_data.get('type') or '').lower()
+        if action_type == "type":
+            return LogEntry('action', icon='⌨️', label='Typed', detail=f'"{action_data.get("text", "")}"')
+        elif action_type == "key":
+            return LogEntry('action', icon='⌨️', label='Pressed', detail=action_data.get('text', ''))
+        elif action_type == "mouse_move":
+            return LogEntry('action', icon='🖱️', label='Moved to',
+                            detail=f"({action_data.get('x', 0)}, {action_data.get('y', 0)})")
+        elif action_type == "screenshot":
+            return LogEntry('screenshot', icon='📸', label='View Screenshot', frame=action_data.get('frame'))
+        elif "click" in action_type:
+            click_map = {
+                "left_click": "Left Click",
+                "right_click": "Right Click",
+                "middle_click": "Middle Click",
+                "double_click": "Double Click"
             }
-        """)
-        
-        # Create layout
-        layout = QVBoxLayout()
-        
-        # Convert base64 to QPixmap
-        import base64
-        from PyQt6.QtGui import QPixmap
-        pixmap_data = base64.b64decode(screenshot_data)
-        pixmap = QPixmap()
-        pixmap.loadFromData(pixmap_data)
-        
-        # Create label and set pixmap
-        label = QLabel()
-        label.setPixmap(pixmap)
-        label.setStyleSheet("background-color: #262626; padding: 8px;")
-        
-        # Add to layout
-        layout.addWidget(label)
-        
-        # Add close button
-        close_button = QPushButton("Close")
-        close_button.clicked.connect(dialog.close)
-        layout.addWidget(close_button)
-        
-        dialog.setLayout(layout)
-        dialog.exec()
-
-    def handle_link_click(self, url):
-        if url.scheme() == "screenshot":
-            self.show_screenshot(self.store.last_screenshot)
+            return LogEntry('action', icon='👆', label=click_map.get(action_type, "Click"),
+                            detail=f"({action_data.get('x', 0)}, {action_data.get('y', 0)})")
+        return None
+
+    def update_usage(self, usage):
+        tokens = usage['total_tokens']
+        self.usage_label.setText(
+            f"Step {usage['step']} · {tokens['input_tokens']:,} in · {tokens['output_tokens']:,} out · "
+            f"{tokens['cache_read_input_tokens']:,} cache read · {tokens['cache_creation_input_tokens']:,} cache write · "
+            f"${usage['total_cost']:.3f}"
+        )
+        self.usage_label.setToolTip(f"Last step: {sum(usage['tokens'].values()):,} tokens, ${usage['cost']:.4f}")
+        self.usage_label.show()
+
+    def show_gallery(self, frame=None):
+        """Open the screenshot gallery at frame index `frame`, the latest one if None"""
+        if self.gallery is None:
+            self.gallery = GalleryDialog(self.frame_loader, self)
+        self.gallery.show()
+        self.gallery.raise_()
+        self.gallery.select(frame)
+
+    def handle_log_click(self, index):
+        entry = index.data(EntryRole)
+        if entry is not None and entry.kind == 'screenshot':
+            self.show_gallery(entry.frame)
+
+    def export_log(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Full Log", "action_log.txt", "Text Files (*.txt)")
+        if path:
+            self.log_model.export(path)
 
     def mousePressEvent(self, event):
         self.oldPos = event.globalPosition().toPoint()
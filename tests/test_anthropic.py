@@ -0,0 +1,82 @@
+import pytest
+from src.anthropic import AnthropicClient, SCREENSHOT_PLACEHOLDER
+from src.benchmark import make_config_service
+from src.frame import Frame
+
+
+@pytest.fixture
+def make_client(tmp_path, monkeypatch):
+    monkeypatch.setenv('ANTHROPIC_API_KEY', 'test')
+
+    def make(**config):
+        config_service = make_config_service(tmp_path)
+        config_service.save({**config_service.config, **config})
+        return AnthropicClient(config_service)
+    return make
+
+
+def make_history(steps):
+    """Instructions, then one screenshot action and its tool_result image per step"""
+    history = [{"role": "user", "content": "Test run"}]
+    for step in range(steps):
+        history.append({"role": "assistant", "content": [
+            {"type": "tool_use", "id": f"tool_{step}", "name": "computer", "input": {"action": "screenshot"}}]})
+        frame = Frame(f"frame {step}".encode(), 1280, 800, 'image/png')
+        history.append({"role": "user", "content": [{"type": "tool_result", "tool_use_id": f"tool_{step}", "content": [
+            {"type": "image", "source": {"type": "frame", "media_type": frame.media_type, "frame": frame}}]}]})
+    return history
+
+
+def sent_frames(messages):
+    """Data of the frames left in a pruned history, or resent as base64 in a request"""
+    frames = []
+    for message in messages:
+        for block in message["content"] if isinstance(message["content"], list) else []:
+            for inner in block.get("content", []) if isinstance(block, dict) else []:
+                if inner["type"] == "image":
+                    source = inner["source"]
+                    frames.append(source["frame"].data if source["type"] == "frame" else source["data"])
+    return frames
+
+
+@pytest.mark.parametrize('keep_last, batch', [(3, 1), (3, 4), (1, 2), (0, 3)])
+def test_pruning_keeps_between_n_and_n_plus_batch(make_client, keep_last, batch):
+    client = make_client()
+    dropped_before = 0
+    for steps in range(12):
+        history = make_history(steps)
+        pruned, dropped, _ = client.prune_screenshots(history, keep_last, batch)
+        kept = len(sent_frames(pruned))
+        assert kept == steps - dropped
+        assert min(steps, keep_last) <= kept <= max(keep_last + batch - 1, min(steps, keep_last))
+        # Older screenshots are dropped in whole batches, so the cached prefix changes rarely
+        assert dropped % batch == 0 and dropped >= dropped_before
+        dropped_before = dropped
+        assert sent_frames(history) == [f"frame {step}".encode() for step in range(steps)]
+
+
+def test_pruning_replaces_oldest_with_placeholder(make_client):
+    client = make_client()
+    pruned, dropped, dropped_bytes = client.prune_screenshots(make_history(6), 2, 1)
+    assert dropped == 4 and dropped_bytes == 4 * len(b"frame 0")
+    assert sent_frames(pruned) == [b"frame 4", b"frame 5"]
+    assert pruned[2]["content"][0]["content"] == [{"type": "text", "text": SCREENSHOT_PLACEHOLDER}]
+
+
+@pytest.mark.parametrize('steps', range(1, 10))
+def test_prepare_images_predicts_build_request(make_client, monkeypatch, steps):
+    client = make_client(max_screenshots_in_history=3, screenshot_prune_batch=2)
+    request_config = client.load_request_config()
+    history = make_history(steps)
+    # As in the store: the images are prepared before the new screenshot is added to the history
+    observation = history[-1]["content"][0]["content"].pop()
+    encoded = client.prepare_images(history, request_config)
+    history[-1]["content"][0]["content"].append(observation)
+
+    encodes = []
+    base64 = Frame.base64
+    monkeypatch.setattr(Frame, 'base64', property(lambda frame: encodes.append(frame.data) or base64.fget(frame)))
+    request = client.build_request(history, request_config, encoded)
+    # Only the new screenshot is encoded when the request is built, every other image was prepared
+    assert encodes == [observation["source"]["frame"].data]
+    assert len(sent_frames(request["messages"])) == len(encoded) + 1
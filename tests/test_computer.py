@@ -0,0 +1,106 @@
+import pyperclip
+import pytest
+from src import computer
+from src.benchmark import make_config_service, make_fake_computer_control
+
+
+class FakeKeyboard:
+    """Stands in for pyautogui, pasting draws the clipboard on the screen if `app_pastes`"""
+
+    def __init__(self, control, clipboard, app_pastes):
+        self.control = control
+        self.clipboard = clipboard
+        self.app_pastes = app_pastes
+        self.written = []
+
+    def hotkey(self, *keys):
+        if self.app_pastes:
+            self.control.capture_backend.apply_action({'type': 'type', 'text': self.clipboard.text})
+
+    def write(self, text, interval=0):
+        self.written.append((text, interval))
+
+
+class FakeClipboard:
+    PyperclipException = pyperclip.PyperclipException
+
+    def __init__(self, text):
+        self.text = text
+
+    def paste(self):
+        return self.text
+
+    def copy(self, text):
+        self.text = text
+
+
+@pytest.fixture
+def make_control(tmp_path, monkeypatch):
+    def make(app_pastes=True, **config):
+        config_service = make_config_service(tmp_path)
+        config_service.save({**config_service.config, 'settle_timeout': 0.2, 'settle_min_delay': 0,
+                             'typing_strategy': 'auto', **config})
+        control = make_fake_computer_control((1280, 800), config_service)
+        clipboard = FakeClipboard("previous")
+        keyboard = FakeKeyboard(control, clipboard, app_pastes)
+        monkeypatch.setattr(computer, 'pyperclip', clipboard)
+        monkeypatch.setattr(computer, 'pyautogui', keyboard)
+        monkeypatch.setattr(computer, 'PASTE_RESTORE_DELAY', 0)
+        return control, clipboard, keyboard
+    return make
+
+
+def test_paste_restores_clipboard(make_control):
+    control, clipboard, keyboard = make_control()
+    assert control.type_text("a long line of text") == 'paste'
+    assert clipboard.text == "previous"
+    assert keyboard.written == []
+
+
+def test_auto_types_text_with_control_characters(make_control):
+    control, clipboard, keyboard = make_control()
+    assert control.type_text("first line\nsecond line") == 'keys'
+    assert keyboard.written == [("first line\nsecond line", 0)]
+
+
+def test_ignored_paste_is_typed_per_key(make_control):
+    control, clipboard, keyboard = make_control(app_pastes=False)
+    assert control.type_text("a long line of text") == 'per_key'
+    assert clipboard.text == "previous"
+    assert keyboard.written == [("a long line of text", control.typing_interval)]
+
+
+@pytest.mark.parametrize('text, settle_timeout', [("a long line of text", 0), ("héllo wörld", 0.2)])
+def test_unverifiable_paste_is_reported(make_control, text, settle_timeout):
+    control, clipboard, keyboard = make_control(app_pastes=False, settle_timeout=settle_timeout)
+    assert control.type_text(text) == computer.UNCONFIRMED_PASTE
+    assert clipboard.text == "previous"
+    assert keyboard.written == []
+
+
+@pytest.mark.parametrize('dedup_threshold, sent', [(0, False), (-1, True)])
+def test_unchanged_crop_respects_dedup(make_control, dedup_threshold, sent):
+    control, clipboard, keyboard = make_control(crop_changes=True, screenshot_dedup_threshold=dedup_threshold)
+    first = control.take_screenshot(dedup=True)
+    second = control.take_screenshot(dedup=True)
+    assert first is not None and first.crop_box is None
+    assert (second is not None) == sent
+    if sent:
+        assert second.crop_box is None and (second.width, second.height) == (first.width, first.height)
+
+
+@pytest.mark.parametrize('max_screenshots, expected', [
+    (3, 'fccfccf'),  # Two crops at most, the full frame they're relative to stays in the history
+    (1, 'fffffff'),  # Only the last image is kept, a crop would have nothing to refer to
+    (None, 'fcccccf'),  # crop_full_frame_every
+])
+def test_full_frame_cadence(make_control, max_screenshots, expected):
+    control, clipboard, keyboard = make_control(crop_changes=True, crop_full_frame_every=5,
+                                                screenshot_dedup_threshold=-1,
+                                                max_screenshots_in_history=max_screenshots)
+    cadence = ''
+    for step in range(len(expected)):
+        control.capture_backend.apply_action({'type': 'type', 'text': f"step {step}"})
+        frame = control.take_screenshot(dedup=True)
+        cadence += 'f' if frame.crop_box is None else 'c'
+    assert cadence == expected
@@ -0,0 +1,35 @@
+import numpy as np
+from anthropic.types.beta import BetaMessage
+from src.computer import HASH_HEIGHT, HASH_WIDTH
+from src.response_cache import ResponseCache, prompt_key
+
+MESSAGE = BetaMessage.model_validate({
+    "id": "msg_1", "type": "message", "role": "assistant", "model": "claude-3-5-sonnet-20241022",
+    "content": [{"type": "tool_use", "id": "tool_1", "name": "computer", "input": {"action": "screenshot"}}],
+    "stop_reason": "tool_use", "stop_sequence": None, "usage": {"input_tokens": 1, "output_tokens": 1},
+})
+
+
+def test_hit_on_similar_screen(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'))
+    key = prompt_key("Open the menu", "system")
+    frame_hash = np.zeros((2, HASH_HEIGHT, HASH_WIDTH), dtype=bool)  # As from ComputerControl.difference_hash
+    cache.put(key, 0, frame_hash, MESSAGE)
+
+    similar = frame_hash.copy()
+    similar.flat[:100] = True  # Under 1% of the bits differ
+    assert cache.get(key, 0, similar) == MESSAGE
+    assert cache.get(key, 0, ~frame_hash) is None
+    assert cache.get(key, 1, frame_hash) is None
+    assert cache.get(prompt_key("Close the menu", "system"), 0, frame_hash) is None
+    assert (cache.hits, cache.misses) == (1, 3)
+    cache.close()
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.sqlite'), max_entries=2)
+    for step in range(3):
+        cache.put("key", step, None, MESSAGE)
+    assert cache.get("key", 0, None) is None
+    assert cache.get("key", 2, None) == MESSAGE
+    cache.close()
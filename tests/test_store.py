@@ -0,0 +1,97 @@
+import os
+import threading
+import pytest
+from src.benchmark import MockMessagesServer, FINISH_STEP, make_config_service, make_fake_computer_control
+from src.store import Store
+
+SCRIPT = [
+    [
+        {"type": "text", "text": "Opening the menu."},
+        {"type": "tool_use", "name": "computer", "input": {"action": "mouse_move", "coordinate": [640, 400]}},
+        {"type": "tool_use", "name": "computer", "input": {"action": "left_click"}},
+    ],
+    [{"type": "tool_use", "name": "computer", "input": {"action": "type", "text": "hello"}}],
+    [{"type": "tool_use", "name": "computer", "input": {"action": "screenshot"}}],
+    FINISH_STEP,
+]
+
+
+@pytest.fixture
+def mock_api(monkeypatch):
+    """Starts a MockMessagesServer for a script, the API client is pointed at it"""
+    servers = []
+
+    def start(script):
+        server = MockMessagesServer(script, delay=0, chunk_delay=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        monkeypatch.setenv('ANTHROPIC_BASE_URL', server.url)
+        monkeypatch.setenv('ANTHROPIC_API_KEY', 'test')
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def run_store(tmp_path, **config):
+    config_service = make_config_service(tmp_path)
+    config_service.save({**config_service.config, 'settle_timeout': 0, **config})
+    store = Store(computer_control=make_fake_computer_control((1280, 800), config_service),
+                  config_service=config_service)
+    store.set_instructions("Test run")
+    messages = []
+    store.run_agent(messages.append)
+    return store, messages
+
+
+@pytest.mark.parametrize('stream_responses', [True, False])
+def test_run_answers_every_tool_use(mock_api, tmp_path, stream_responses):
+    server = mock_api(SCRIPT)
+    store, messages = run_store(tmp_path, stream_responses=stream_responses)
+
+    assert store.error is None, messages
+    assert "Task completed successfully." in messages
+    assert len(server.requests) == len(SCRIPT)
+    # Every assistant turn is followed by one tool_result per tool_use, with matching ids
+    for assistant, results in zip(store.run_history[1::2], store.run_history[2::2]):
+        tool_use_ids = [block.id for block in assistant.content if block.type == 'tool_use']
+        assert [result['tool_use_id'] for result in results['content']] == tool_use_ids
+
+
+@pytest.mark.parametrize('finish, saved', [
+    ({"type": "tool_use", "name": "finish_run", "input": {"success": True}}, True),
+    ({"type": "tool_use", "name": "finish_run", "input": {"success": False, "error": "Stuck"}}, False),
+    ({"type": "text", "text": "Which file do you mean?"}, False),  # Becomes a synthetic finish_run
+])
+def test_only_successful_runs_are_recorded(mock_api, tmp_path, finish, saved):
+    mock_api(SCRIPT[:-1] + [[finish]])
+    macro_dir = tmp_path / 'macros'
+    store, messages = run_store(tmp_path, record_macros=True, macro_dir=str(macro_dir))
+
+    assert store.error is None, messages
+    assert (macro_dir.exists() and len(os.listdir(macro_dir)) > 0) == saved
+
+
+@pytest.mark.parametrize('stream_responses', [True, False])
+def test_stop_skips_remaining_actions(mock_api, tmp_path, stream_responses):
+    server = mock_api(SCRIPT)
+    config_service = make_config_service(tmp_path)
+    config_service.save({**config_service.config, 'settle_timeout': 0, 'stream_responses': stream_responses})
+    computer_control = make_fake_computer_control((1280, 800), config_service)
+    store = Store(computer_control=computer_control, config_service=config_service)
+    performed = []
+    perform_action = computer_control.perform_action
+
+    def perform_and_stop(action):
+        performed.append(action['type'])
+        store.stop_run()
+        return perform_action(action)
+
+    computer_control.perform_action = perform_and_stop
+    store.set_instructions("Test run")
+    store.run_agent(lambda message: None)
+
+    assert performed == ['mouse_move']
+    assert len(server.requests) == 1
@@ -0,0 +1,24 @@
+from types import SimpleNamespace
+from src.usage import RunUsage
+
+USAGE = SimpleNamespace(input_tokens=1000, output_tokens=100, cache_creation_input_tokens=2000,
+                        cache_read_input_tokens=None)
+
+
+def test_totals_and_cost():
+    usage = RunUsage()
+    usage.add_step(USAGE, 'claude-3-5-sonnet-20241022')
+    record = usage.add_step(None)  # Served from the response cache
+    assert record['tokens'] == dict.fromkeys(record['tokens'], 0)
+    assert usage.steps == 2 and usage.total_tokens == 3100
+    assert usage.cost == (1000 * 3.00 + 100 * 15.00 + 2000 * 3.75) / 1_000_000
+
+
+def test_budget_exceeded():
+    assert RunUsage(max_steps=2).budget_exceeded() is None
+    for usage in (RunUsage(max_steps=1), RunUsage(max_tokens=3100), RunUsage(max_cost=0.01)):
+        usage.add_step(USAGE)
+        assert usage.budget_exceeded() is not None
+    usage = RunUsage(max_tokens=3101, max_cost=0.02)
+    usage.add_step(USAGE)
+    assert usage.budget_exceeded() is None